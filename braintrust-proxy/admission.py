@@ -0,0 +1,216 @@
+"""
+Per-tenant admission control.
+
+A tenant is whoever a request identifies as: the tenant header, else a hash
+of its API key. Each tenant gets a requests/sec and a tokens/min token
+bucket and a concurrency limit, and every tenant shares an optional global
+concurrency limit. A request that can't start right away waits in its
+tenant's FIFO; freed slots are handed out round-robin across tenants, so a
+bulk ingest with hundreds of queued requests can't starve another tenant's
+interactive chat. Anything that would wait longer than `max_wait` is
+rejected with a retry-after hint instead.
+
+Rate buckets are reserved up front (the balance may go negative), so later
+requests see the queue ahead of them in their wait estimate. Completion
+tokens are charged once known.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+
+from metrics import ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED, ADMISSION_WAITING
+
+
+def tenant_id(headers, header="X-Tenant-ID"):
+    """Tenant header, else a short hash of the bearer key, else "anonymous"."""
+    tenant = headers.get(header)
+    if tenant:
+        return tenant
+    auth = headers.get("Authorization", "")
+    if auth.lower().startswith("bearer ") and auth[7:].strip():
+        return "key:" + hashlib.sha256(auth[7:].strip().encode()).hexdigest()[:12]
+    return "anonymous"
+
+
+class Rejected(Exception):
+    """The request can't be admitted within the max wait."""
+
+    def __init__(self, tenant, reason, retry_after):
+        super().__init__(f"Rate limit exceeded for tenant {tenant} ({reason}); retry after {retry_after}s")
+        self.tenant = tenant
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # per second
+        self.burst = burst
+        self.level = burst
+        self._at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.burst, self.level + (now - self._at) * self.rate)
+        self._at = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` (capped at the burst size) is available."""
+        self._refill()
+        return max(0.0, (min(amount, self.burst) - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        # Never owe more than one burst, so one huge request can't lock a tenant out.
+        self.level = max(self.level - amount, -self.burst)
+
+    def refund(self, amount):
+        self.level = min(self.burst, self.level + amount)
+
+
+class _Tenant:
+    def __init__(self, name, rps, burst, tpm, concurrency):
+        self.name = name
+        self.requests = TokenBucket(rps, burst or max(1.0, rps)) if rps else None
+        self.tokens = TokenBucket(tpm / 60.0, tpm) if tpm else None
+        self.concurrency = concurrency
+        self.active = 0
+        self.waiters = deque()
+
+
+class Ticket:
+    """An admitted request's slot; release when the response is finished."""
+
+    def __init__(self, controller, tenant, queue_seconds):
+        self._controller = controller
+        self._tenant = tenant
+        self.tenant = tenant.name
+        self.queue_seconds = queue_seconds
+        self._released = False
+
+    def charge(self, tokens):
+        """Debit tokens learned after the fact (completion tokens) from the tenant's TPM bucket."""
+        if self._tenant.tokens and tokens:
+            self._tenant.tokens.take(tokens)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._tenant)
+
+
+class AdmissionController:
+    """Token buckets + concurrency limits per tenant, fair-queued with a max wait."""
+
+    def __init__(self, rps=0.0, burst=0.0, tpm=0, concurrency=0, global_concurrency=0,
+                 max_wait=10.0, overrides=None, label=lambda tenant: tenant):
+        self.defaults = {"rps": rps, "burst": burst, "tpm": tpm, "concurrency": concurrency}
+        self.overrides = overrides or {}
+        self.global_concurrency = global_concurrency
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._label = label
+        self._tenants = {}
+        self._ring = OrderedDict()  # tenants with waiters, in round-robin order
+
+    def _tenant(self, name):
+        state = self._tenants.get(name)
+        if state is None:
+            limits = {**self.defaults, **self.overrides.get(name, {})}
+            state = self._tenants[name] = _Tenant(name, limits["rps"], limits["burst"],
+                                                  limits["tpm"], limits["concurrency"])
+        return state
+
+    def _free(self, state):
+        return ((not state.concurrency or state.active < state.concurrency)
+                and (not self.global_concurrency or self.active < self.global_concurrency))
+
+    async def acquire(self, tenant, tokens=0):
+        """Wait for a slot (up to max_wait); returns a Ticket or raises Rejected."""
+        started = time.monotonic()
+        state = self._tenant(tenant)
+
+        buckets = [(bucket, amount) for bucket, amount in ((state.requests, 1), (state.tokens, tokens)) if bucket]
+        wait = max((bucket.wait_for(amount) for bucket, amount in buckets), default=0.0)
+        if wait > self.max_wait:
+            self._reject(state, "rate", wait)
+        for bucket, amount in buckets:
+            bucket.take(amount)
+        if wait:
+            await asyncio.sleep(wait)
+
+        if not self._free(state) or state.waiters:
+            remaining = self.max_wait - (time.monotonic() - started)
+            future = asyncio.get_running_loop().create_future()
+            state.waiters.append(future)
+            self._ring[state.name] = state
+            self._wake()  # the waiters ahead may have timed out already
+            ADMISSION_WAITING.inc()
+            try:
+                await asyncio.wait({future}, timeout=max(remaining, 0))
+            except asyncio.CancelledError:
+                # Client went away while queued; give back a slot handed over meanwhile.
+                if future.done():
+                    self._release(state)
+                else:
+                    future.cancel()
+                raise
+            finally:
+                ADMISSION_WAITING.dec()
+            if not future.done():
+                future.cancel()
+                for bucket, amount in buckets:
+                    bucket.refund(amount)
+                self._reject(state, "queue_timeout", self.max_wait)
+        else:
+            state.active += 1
+            self.active += 1
+
+        queued = time.monotonic() - started
+        self.admitted += 1
+        ADMISSION_QUEUE_WAIT.labels(self._label(state.name)).observe(queued)
+        return Ticket(self, state, queued)
+
+    def _reject(self, state, reason, wait):
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(self._label(state.name), reason).inc()
+        raise Rejected(state.name, reason, max(1, math.ceil(wait)))
+
+    def _release(self, state):
+        state.active -= 1
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        """Hand free slots to waiting tenants, one per tenant per pass."""
+        progressed = True
+        while progressed and self._ring:
+            progressed = False
+            for name, state in list(self._ring.items()):
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()  # timed out
+                if not state.waiters:
+                    del self._ring[name]
+                    continue
+                if self._free(state):
+                    state.active += 1
+                    self.active += 1
+                    state.waiters.popleft().set_result(None)
+                    self._ring.move_to_end(name)
+                    progressed = True
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waiting": sum(len(state.waiters) for state in self._tenants.values()),
+            "tenants": {
+                name: {"active": state.active, "waiting": len(state.waiters)}
+                for name, state in self._tenants.items() if state.active or state.waiters
+            },
+        }
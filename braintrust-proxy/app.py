@@ -1,188 +1,1165 @@
 """
 Braintrust Proxy for AnythingLLM + OpenRouter
 Captures all LLM calls and logs to Braintrust for observability.
+
+Runs as an ASGI app (Quart) so an open stream holds a coroutine, not a
+worker process: one worker can serve thousands of concurrent streams.
 """
 import os
 import json
 import time
 import sys
-from flask import Flask, request, Response, jsonify
-from openai import OpenAI
+import asyncio
+import fnmatch
+import httpx
+from quart import Quart, g, request, Response, jsonify
+from openai import APIStatusError, AsyncOpenAI
 import braintrust
 
-app = Flask(__name__)
+import codec
+import metrics
+from shipper import LogShipper
+from spool import LogSpool
+from logpolicy import LogPolicy, parse_rules
+from sse import SSETap, completion_events
+from cache import ResponseCache, cache_policy, canonical_key
+from embedcache import EmbeddingCache
+from batcher import EmbeddingBatcher, estimate_tokens
+from singleflight import SingleFlight
+from catalog import ModelCatalog
+from context import ContextGuard, ContextLimitExceeded, TokenEstimator, load_encoding
+from promptcache import PromptCacheHints, cached_tokens
+from upstream import build_http_client
+from router import Router, Upstream, parse_config, retryable
+from breaker import Breakers, CircuitOpen
+from admission import AdmissionController, Rejected, tenant_id
+from budget import BudgetExceeded, Budgets, SpendStore, request_cost
+from passthrough import BodyTap, request_headers, response_headers
+from vectors import FORMATS as EMBEDDING_FORMATS, decode_embedding, embeddings_body
 
-# Configure OpenRouter client
-openrouter = OpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1",
-)
+app = Quart(__name__)
+
+# orjson when installed; JSON_CODEC=json forces the stdlib encoder.
+codec.select(os.getenv("JSON_CODEC"))
+# Long reasoning streams routinely outlive Quart's 60s default.
+app.config["RESPONSE_TIMEOUT"] = None
+# No request size cap unless configured (Quart defaults to 16 MiB; Flask had
+# none), and time for large embedding batches or uploads to arrive.
+max_request_mb = float(os.getenv("MAX_REQUEST_MB", 0))
+app.config["MAX_CONTENT_LENGTH"] = int(max_request_mb * 1024 * 1024) if max_request_mb > 0 else None
+app.config["BODY_TIMEOUT"] = int(os.getenv("REQUEST_BODY_TIMEOUT", 300))
+
+# Label values seen by this worker; later ones share "other" so a caller
+# can't blow up series cardinality with made-up model or tenant names.
+model_label = metrics.BoundedLabel(int(os.getenv("METRICS_MAX_MODELS", 200)))
+tenant_label = metrics.BoundedLabel(int(os.getenv("METRICS_MAX_TENANTS", 100)))
+
+
+# Upstreams and model routes (default: OpenRouter for everything). Parsed at
+# import so a bad UPSTREAMS fails fast; clients are built per worker in
+# `start_upstream` (after fork) so no pooled connection is ever shared
+# between processes.
+upstream_specs, upstream_routes = parse_config(os.getenv("UPSTREAMS"))
+router = None
+
+
+def create_upstream_client(spec):
+    """AsyncOpenAI over a pooled keep-alive (HTTP/2 when available) transport.
+
+    Returns (client, transport, httpx client the SDK client sends through).
+    """
+    http_client, transport, timeout = build_http_client(
+        http2=os.getenv("UPSTREAM_HTTP2", "true").lower() == "true",
+        max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100)),
+        max_keepalive=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 60)),
+        connect_timeout=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.getenv("UPSTREAM_READ_TIMEOUT", 300)),
+        write_timeout=float(os.getenv("UPSTREAM_WRITE_TIMEOUT", 30)),
+        pool_timeout=float(os.getenv("UPSTREAM_POOL_TIMEOUT", 10)),
+    )
+    client = AsyncOpenAI(
+        api_key=os.getenv(spec.get("api_key_env", "OPENROUTER_API_KEY")),
+        base_url=spec["base_url"],
+        http_client=http_client,
+        timeout=timeout,
+    )
+    return client, transport, http_client
+
+
+def create_router():
+    upstreams = {}
+    for name, spec in upstream_specs.items():
+        client, transport, http_client = create_upstream_client(spec)
+        upstreams[name] = Upstream(name, client, transport, models=spec.get("models"),
+                                   half_life=float(os.getenv("ROUTER_HEALTH_HALF_LIFE", 30)),
+                                   http_client=http_client)
+    return Router(
+        upstreams,
+        upstream_routes,
+        degrade_ratio=float(os.getenv("ROUTER_DEGRADE_RATIO", 3)),
+        hedge=os.getenv("ROUTER_HEDGE", "false").lower() == "true",
+        hedge_min_delay=float(os.getenv("ROUTER_HEDGE_MIN_DELAY_MS", 500)) / 1000,
+    )
+
+
+# Per-model circuit breakers: a failing model fails fast instead of tying up
+# connections for the full timeout. CIRCUIT_BREAKER=false disables.
+breakers = None
+if os.getenv("CIRCUIT_BREAKER", "true").lower() == "true":
+    breakers = Breakers(
+        label=model_label,
+        window=int(os.getenv("CIRCUIT_WINDOW", 20)),
+        min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", 5)),
+        error_ratio=float(os.getenv("CIRCUIT_ERROR_RATIO", 0.5)),
+        slow_seconds=float(os.getenv("CIRCUIT_SLOW_MS", 0)) / 1000,
+        open_seconds=float(os.getenv("CIRCUIT_OPEN_SECONDS", 30)),
+    )
+
+
+async def routed(model, fn, op, hedge=False):
+    """`router.call` behind the model's circuit breaker (raises CircuitOpen)."""
+    if breakers is None:
+        return await router.call(model, fn, op, hedge=hedge)
+    breakers.allow(model)
+    started = time.monotonic()
+    try:
+        result = await router.call(model, fn, op, hedge=hedge)
+    except asyncio.CancelledError:
+        breakers.record(model, None)
+        raise
+    except Exception as e:
+        # Only upstream-side failures count; a 400 is the caller's problem.
+        breakers.record(model, retryable(e), time.monotonic() - started)
+        raise
+    breakers.record(model, False, time.monotonic() - started)
+    return result
+
+
+# Per-tenant admission control; off unless a limit is configured.
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Tenant-ID")
+tenant_limits = {
+    "rps": float(os.getenv("TENANT_RPS", 0)),
+    "burst": float(os.getenv("TENANT_RPS_BURST", 0)),
+    "tpm": int(os.getenv("TENANT_TPM", 0)),
+    "concurrency": int(os.getenv("TENANT_MAX_CONCURRENCY", 0)),
+}
+tenant_overrides = json.loads(os.getenv("TENANT_LIMITS") or "{}")
+global_concurrency = int(os.getenv("PROXY_MAX_CONCURRENCY", 0))
+admission = None
+if any(tenant_limits.values()) or tenant_overrides or global_concurrency:
+    admission = AdmissionController(
+        **tenant_limits,
+        global_concurrency=global_concurrency,
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT_MS", 10000)) / 1000,
+        overrides=tenant_overrides,
+        label=tenant_label,
+    )
+
+
+async def admit(tokens):
+    """Wait for the tenant's admission slot (raises Rejected).
+
+    The ticket is kept on `g` and released when the request ends, unless a
+    stream takes it over to release when the stream finishes.
+    """
+    if admission is not None:
+        g.ticket = await admission.acquire(g.tenant, tokens)
+        g.queue_ms = g.ticket.queue_seconds * 1000
+
+
+def rate_limited_response(e):
+    """OpenAI-style 429 for a request admission control turned away."""
+    body = {"error": {"message": str(e), "type": "requests", "code": "rate_limit_exceeded", "param": None}}
+    return jsonify(body), 429, {"Retry-After": str(e.retry_after)}
+
+
+def circuit_open_response(e):
+    """OpenAI-style 503 for a model whose breaker is open."""
+    body = {"error": {"message": str(e), "type": "server_error", "code": "circuit_open", "param": None}}
+    return jsonify(body), 503, {"Retry-After": str(e.retry_after)}
+
+
+def budget_exceeded_response(e):
+    """402 (as OpenRouter answers when credits run out) for a tenant past its hard budget."""
+    body = {"error": {"message": str(e), "type": "insufficient_quota", "code": "budget_exceeded", "param": None}}
+    return jsonify(body), 402
+
+
+def context_length_response(e):
+    """OpenAI-style 400 for a request that can't fit the model's context window."""
+    body = {"error": {"message": str(e), "type": "invalid_request_error", "code": "context_length_exceeded",
+                      "param": e.param}}
+    return jsonify(body), 400
+
+
+async def request_object():
+    """The request body as a JSON object, or None if it isn't one."""
+    try:
+        data = codec.loads(await request.get_data())
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def invalid_param_response(message, param):
+    """OpenAI-style 400 for a request field with the wrong type or value."""
+    body = {"error": {"message": message, "type": "invalid_request_error", "code": None, "param": param}}
+    return jsonify(body), 400
+
+
+def invalid_body_response():
+    """OpenAI-style 400 for a body that isn't a JSON object."""
+    body = {"error": {"message": "The request body must be a JSON object", "type": "invalid_request_error",
+                      "code": None, "param": None}}
+    return jsonify(body), 400
+
+
+def upstream_error_response(e):
+    """The upstream's own status and error body, for an error the router didn't fail over (or ran out of upstreams)."""
+    error = e.body if isinstance(e.body, dict) else {"message": e.message, "type": "upstream_error", "param": None}
+    headers = {"Retry-After": e.response.headers["Retry-After"]} if "Retry-After" in e.response.headers else {}
+    return jsonify({"error": error}), e.status_code, headers
 
-def get_logger():
-    """Get or create Braintrust logger (handles gunicorn worker forks)."""
+
+def get_logger(project=None):
+    """Create a Braintrust logger for `project` (default project if None).
+
+    Called by the shipper thread once per project per worker, after the fork.
+    """
     return braintrust.init_logger(
-        project=os.getenv("BRAINTRUST_PROJECT_NAME", "AnythingLLM"),
+        project=project or os.getenv("BRAINTRUST_PROJECT_NAME", "AnythingLLM"),
         api_key=os.getenv("BRAINTRUST_API_KEY"),
+        set_current=False,
+    )
+
+
+# Tenant -> Braintrust project. Unmapped tenants use TENANT_PROJECT_TEMPLATE
+# (e.g. "AnythingLLM-{tenant}") if set, else the default project.
+tenant_projects = json.loads(os.getenv("TENANT_PROJECTS") or "{}")
+tenant_project_template = os.getenv("TENANT_PROJECT_TEMPLATE")
+
+
+def project_for(tenant):
+    """Braintrust project for a tenant's traces; None means the default project."""
+    if tenant in tenant_projects:
+        return tenant_projects[tenant]
+    if tenant_project_template and tenant and tenant != "anonymous":
+        return tenant_project_template.format(tenant=tenant)
+    return None
+
+
+# Durable spill-to-disk queue for traces Braintrust could not accept.
+# Set LOG_SPOOL_PATH="" to disable (failed batches are then dropped).
+spool_path = os.getenv("LOG_SPOOL_PATH", "/tmp/braintrust-proxy/spool.db")
+spool = None
+if spool_path:
+    # Make flush() raise on failure instead of silently dropping the batch;
+    # the spool owns retries, so skip the SDK's own sleep-and-retry loop.
+    os.environ.setdefault("BRAINTRUST_SYNC_FLUSH", "true")
+    os.environ.setdefault("BRAINTRUST_NUM_RETRIES", "0")
+    spool = LogSpool(spool_path, max_bytes=int(os.getenv("LOG_SPOOL_MAX_MB", 256)) * 1024 * 1024)
+
+# Per-worker background shipper: handlers enqueue, a thread batches to Braintrust.
+shipper = LogShipper(
+    get_logger,
+    max_queue=int(os.getenv("LOG_QUEUE_MAX", 10000)),
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", 100)),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", 1.0)),
+    spool=spool,
+    max_backoff=float(os.getenv("LOG_REPLAY_MAX_BACKOFF", 300)),
+    max_loggers=int(os.getenv("BRAINTRUST_MAX_LOGGERS", 64)),
+)
+
+# Sampling, conversation deltas and truncation, applied before a trace is queued.
+log_policy = LogPolicy(
+    rules=parse_rules(os.getenv("LOG_SAMPLE_RULES")),
+    default_rate=float(os.getenv("LOG_SAMPLE_RATE", 1.0)),
+    keep_slow_ms=float(os.getenv("LOG_KEEP_SLOW_MS", 0)),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", 0)),
+    delta=os.getenv("LOG_CONVERSATION_DELTA", "false").lower() == "true",
+    max_prefixes=int(os.getenv("LOG_DELTA_MAX_PREFIXES", 10000)),
+)
+
+
+def submit_trace(route, keep=False, **event):
+    """Queue a trace through the log policy; False if sampled out or dropped."""
+    event = log_policy.apply(route, event, keep=keep)
+    if event is None:
+        return False
+    project = project_for(event["metadata"].get("tenant"))
+    if project is not None:
+        event["_project"] = project
+    return shipper.submit(**event)
+
+
+# Opt-in exact-match cache for deterministic chat completions.
+response_cache = None
+if os.getenv("RESPONSE_CACHE", "false").lower() == "true":
+    response_cache = ResponseCache(
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_MB", 64)) * 1024 * 1024,
+        disk_path=os.getenv("RESPONSE_CACHE_DISK_PATH") or None,
+        disk_max_bytes=int(os.getenv("RESPONSE_CACHE_DISK_MAX_MB", 1024)) * 1024 * 1024,
+    )
+
+
+# Per-text embedding cache (opt-in); only texts never embedded before go
+# upstream. Point EMBED_CACHE_PATH at a volume to enable it.
+embed_cache_path = os.getenv("EMBED_CACHE_PATH", "")
+embedding_cache = None
+if embed_cache_path:
+    embedding_cache = EmbeddingCache(
+        embed_cache_path,
+        max_bytes=int(os.getenv("EMBED_CACHE_MAX_MB", 1024)) * 1024 * 1024,
+        mmap_bytes=int(os.getenv("EMBED_CACHE_MMAP_MB", 64)) * 1024 * 1024,
+    )
+
+
+# Identical concurrent non-streaming requests share one upstream call.
+single_flight = SingleFlight() if os.getenv("SINGLE_FLIGHT", "true").lower() == "true" else None
+
+
+async def coalesced(key, fn):
+    """Run `fn()` through single-flight when enabled. Returns (result, shared)."""
+    if single_flight is None:
+        return await fn(), False
+    return await single_flight.do(key, fn)
+
+
+# Chat body keys the proxy sets itself; everything else is forwarded as-is.
+PROXY_OWNED_KEYS = ("model", "messages", "stream", "stream_options")
+TRACE_PARAMS = ("temperature", "max_tokens", "max_completion_tokens", "top_p", "frequency_penalty",
+                "presence_penalty", "stop", "seed")
+
+
+def trace_params(kwargs):
+    """Request params for trace metadata; tool and schema definitions are named, not copied."""
+    params = {key: kwargs[key] for key in TRACE_PARAMS if key in kwargs}
+    if kwargs.get("tools"):
+        params["tools"] = [(tool.get("function") or {}).get("name") or tool.get("type") for tool in kwargs["tools"]]
+    if isinstance(kwargs.get("response_format"), dict):
+        params["response_format"] = kwargs["response_format"].get("type")
+    return params
+
+
+def cacheable(kwargs):
+    """Only temperature-0 requests are cached unless RESPONSE_CACHE_ALL=true."""
+    if os.getenv("RESPONSE_CACHE_ALL", "false").lower() == "true":
+        return True
+    return kwargs.get("temperature") == 0
+
+
+async def fetch_models():
+    """Raw upstream catalog entries, parsed once per refresh."""
+    with metrics.UPSTREAM_LATENCY.labels("/v1/models", "").time():
+        raw = await router.default.client.models.with_raw_response.list()
+    return codec.loads(raw.http_response.content).get("data", [])
+
+
+# /v1/models catalog, also the source of context-length and pricing metadata.
+catalog = ModelCatalog(fetch_models, ttl=int(os.getenv("MODELS_CACHE_TTL", 300)))
+catalog_task = None
+
+# Pre-flight prompt token estimate, checked against the catalog's context
+# lengths. CONTEXT_POLICY=off still estimates (admission uses it).
+context_guard = ContextGuard(
+    catalog,
+    TokenEstimator(
+        load_encoding(os.getenv("CONTEXT_TOKENIZER_ENCODING", "o200k_base"))
+        if os.getenv("CONTEXT_TOKENIZER", "tiktoken").lower() == "tiktoken" else None,
+        chars_per_token=float(os.getenv("CONTEXT_CHARS_PER_TOKEN", 4.0)),
+    ),
+    policy=os.getenv("CONTEXT_POLICY", "clamp").lower(),
+    margin=float(os.getenv("CONTEXT_SAFETY_MARGIN", 0.05)),
+    label=model_label,
+)
+
+# Opt-in cache_control breakpoints on prompt prefixes a tenant keeps resending.
+prompt_cache = None
+if os.getenv("PROMPT_CACHE_HINTS", "false").lower() == "true":
+    prompt_cache = PromptCacheHints(
+        models=[p.strip() for p in os.getenv("PROMPT_CACHE_MODELS", "anthropic/*,google/gemini-*").split(",") if p.strip()],
+        min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 1024)),
+        min_repeats=int(os.getenv("PROMPT_CACHE_MIN_REPEATS", 2)),
+        ttl=float(os.getenv("PROMPT_CACHE_TTL", 300)),
+        label=model_label,
     )
 
+# Per-request cost from catalog pricing, summed per tenant in a SQLite file
+# shared by the workers. Budgets apply once a soft or hard limit is set;
+# SPEND_DB_PATH="" keeps spend per worker (and lost on restart).
+spend_path = os.getenv("SPEND_DB_PATH", "/tmp/braintrust-proxy/spend.db")
+budgets = Budgets(
+    SpendStore(spend_path) if spend_path else None,
+    soft=float(os.getenv("BUDGET_SOFT_USD", 0)),
+    hard=float(os.getenv("BUDGET_HARD_USD", 0)),
+    downgrade=os.getenv("BUDGET_DOWNGRADE_MODEL") or None,
+    overrides=json.loads(os.getenv("TENANT_BUDGETS") or "{}"),
+    period=os.getenv("BUDGET_PERIOD", "month"),
+    sync_interval=float(os.getenv("SPEND_SYNC_INTERVAL", 5)),
+    label=tenant_label,
+)
+budget_task = None
+
+
+def charge_cost(model, tenant, usage, requests=1):
+    """Price one upstream call, add it to the tenant's spend and metrics; returns USD."""
+    cost = request_cost(catalog.pricing(model), usage, requests)
+    if cost:
+        metrics.COST.labels(model_label(model), tenant_label(tenant)).inc(cost)
+        budgets.charge(tenant, cost)
+    return cost
+
+
+@app.before_serving
+async def start_upstream():
+    """Open this worker's upstream connection pools."""
+    global router
+    router = create_router()
+
+
+@app.after_serving
+async def close_upstream():
+    if router is not None:
+        for upstream in router.upstreams.values():
+            await upstream.client.close()
+
+
+@app.before_serving
+async def start_shipper():
+    """Start the log shipper inside the worker (after gunicorn forks)."""
+    shipper.start()
+
+
+@app.before_serving
+async def warm_catalog():
+    """Load the model catalog up front; optionally keep refreshing it."""
+    global catalog_task
+    interval = int(os.getenv("MODELS_REFRESH_INTERVAL", 0))
+    if interval > 0:
+        catalog_task = asyncio.ensure_future(catalog.run(interval))
+    else:
+        catalog.refresh_in_background()
+
+
+@app.after_serving
+async def stop_catalog():
+    if catalog_task is not None:
+        catalog_task.cancel()
+
+
+@app.before_serving
+async def start_budgets():
+    """Keep this worker's view of every tenant's spend current."""
+    global budget_task
+    budget_task = asyncio.ensure_future(budgets.run())
+
+
+@app.after_serving
+async def stop_budgets():
+    """Write this worker's last charges before exiting."""
+    if budget_task is not None:
+        budget_task.cancel()
+    await asyncio.to_thread(budgets.sync)
+
+
+@app.after_serving
+async def drain_shipper():
+    """Drain queued traces to Braintrust before the worker exits."""
+    await asyncio.to_thread(shipper.stop, float(os.getenv("LOG_DRAIN_TIMEOUT", 10)))
+
+
+@app.before_request
+async def identify_tenant():
+    g.tenant = tenant_id(request.headers, TENANT_HEADER)
+    g.queue_ms = 0.0
+
+
+@app.teardown_request
+async def release_admission(exc):
+    ticket = g.pop("ticket", None)
+    if ticket is not None:
+        ticket.release()
+
+
+@app.after_request
+async def count_request(response):
+    """Count every response by route, model and status."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUESTS.labels(route, model_label(g.get("model", "")), str(response.status_code)).inc()
+    return response
+
 
 @app.route("/health", methods=["GET"])
-def health():
+async def health():
     """Health check endpoint."""
     return jsonify({"status": "ok", "service": "braintrust-proxy"})
 
 
+@app.route("/stats", methods=["GET"])
+async def stats():
+    """Per-worker internals (log shipper queue depth, spool backlog, cache hit rates)."""
+    snapshot = {"pid": os.getpid(), "json_codec": codec.name, "log_shipper": await asyncio.to_thread(shipper.stats)}
+    if response_cache is not None:
+        snapshot["response_cache"] = response_cache.stats()
+    if embedding_cache is not None:
+        snapshot["embedding_cache"] = await asyncio.to_thread(embedding_cache.stats)
+    if embedding_batcher is not None:
+        snapshot["embedding_batcher"] = embedding_batcher.stats()
+    if single_flight is not None:
+        snapshot["single_flight"] = single_flight.stats()
+    snapshot["model_catalog"] = catalog.stats()
+    if router is not None:
+        snapshot["router"] = router.stats()
+    if breakers is not None:
+        snapshot["circuit_breakers"] = breakers.stats()
+    if admission is not None:
+        snapshot["admission"] = admission.stats()
+    snapshot["log_policy"] = log_policy.stats()
+    snapshot["context"] = context_guard.stats()
+    snapshot["budgets"] = budgets.stats()
+    if prompt_cache is not None:
+        snapshot["prompt_cache"] = prompt_cache.stats()
+    return jsonify(snapshot)
+
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics():
+    """Prometheus exposition, aggregated across all gunicorn workers."""
+    body = await asyncio.to_thread(metrics.render)
+    return Response(body, content_type=metrics.CONTENT_TYPE)
+
+
 @app.route("/v1/models", methods=["GET"])
-def list_models():
-    """Proxy models list from OpenRouter."""
+async def list_models():
+    """Serve the cached OpenRouter models list (ETag / If-None-Match, gzip)."""
     try:
-        models = openrouter.models.list()
-        return jsonify(models.model_dump())
+        # Every AnythingLLM settings page load hits this; serve pre-encoded bytes.
+        snapshot = await catalog.get()
+        headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if snapshot.etag in request.headers.get("If-None-Match", ""):
+            return Response(b"", status=304, headers=headers)
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(snapshot.gzip_body, mimetype="application/json", headers=headers)
+        return Response(snapshot.body, mimetype="application/json", headers=headers)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/v1/chat/completions", methods=["POST"])
-def chat_completions():
+async def chat_completions():
     """Proxy chat completions with Braintrust tracing."""
     try:
-        data = request.json
+        data = await request_object()
+        if data is None:
+            return invalid_body_response()
         messages = data.get("messages", [])
         model = data.get("model", "openai/gpt-3.5-turbo")
         stream = data.get("stream", False)
+        if not isinstance(model, str) or not model:
+            return invalid_param_response("'model' must be a non-empty string", "model")
+        g.model = model
+        if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+            return invalid_param_response("'messages' must be an array of message objects", "messages")
 
-        # Extract optional parameters
-        kwargs = {}
-        for key in ["temperature", "max_tokens", "top_p", "frequency_penalty", "presence_penalty", "stop"]:
-            if key in data:
-                kwargs[key] = data[key]
+        # Tenants past their soft budget go to the downgrade model; past the
+        # hard budget they are refused before the cache or upstream.
+        budget = {}
+        model, budget_action = budgets.check(g.tenant, model)
+        if budget_action:
+            budget["budget"] = budget_action
+        if budget_action == "downgraded":
+            budget["requested_model"] = g.model
+            g.model = model
 
-        if stream:
-            return stream_chat_completion(messages, model, **kwargs)
+        # Everything except what the proxy sets itself goes upstream as sent
+        # (tools, response_format, seed, provider routing, ...).
+        kwargs = {key: value for key, value in data.items() if key not in PROXY_OWNED_KEYS}
 
-        # Non-streaming request
         start_time = time.time()
+        request_key = canonical_key(model, messages, kwargs)
+
+        # Exact-match cache (opt-in); a bypass header skips the lookup.
+        cache_key, cache_write = None, False
+        if response_cache is not None and cacheable(kwargs):
+            cache_read, cache_write = cache_policy(request.headers)
+            cache_key = request_key
+            cached = await response_cache.get(cache_key) if cache_read else None
+            if cached is not None:
+                return cached_chat_completion(cached, messages, model, stream, start_time, kwargs)
+
+        # Oversized prompts are refused here instead of after an upstream round trip.
+        prompt_estimate, token_base, requested_max = context_guard.check(model, messages, kwargs)
+        preflight = {"prompt_tokens_estimated": prompt_estimate, **budget}
+        if requested_max is not None:
+            preflight["max_tokens_requested"] = requested_max
+        await admit(prompt_estimate)
+
+        upstream_messages = messages
+        if prompt_cache is not None:
+            upstream_messages, breakpoints = prompt_cache.apply(g.tenant, model, messages)
+            if breakpoints:
+                preflight["prompt_cache_breakpoints"] = breakpoints
+
+        if stream:
+            client_usage = bool((data.get("stream_options") or {}).get("include_usage"))
+            resp = await stream_chat_completion(messages, model, cache_key=cache_key if cache_write else None,
+                                                client_usage=client_usage, preflight=preflight,
+                                                token_base=token_base, upstream_messages=upstream_messages,
+                                                params=kwargs)
+            if cache_key:
+                resp.headers["X-Proxy-Cache"] = "MISS"
+            return resp
+
+        # Non-streaming request; identical concurrent requests wait on one upstream call.
+        async def create(client, upstream_model):
+            return await client.chat.completions.create(
+                model=upstream_model,
+                messages=upstream_messages,
+                extra_body=kwargs,
+            )
+
+        async def complete():
+            with metrics.UPSTREAM_LATENCY.labels("/v1/chat/completions", model_label(model)).time():
+                response, route = await routed(model, create, "chat", hedge=True)
+            return response, codec.dump_model(response), route
 
-        response = openrouter.chat.completions.create(
-            model=model,
-            messages=messages,
-            **kwargs
-        )
+        (response, body, route), coalesced_call = await coalesced(request_key, complete)
 
         duration_ms = (time.time() - start_time) * 1000
-        content = response.choices[0].message.content if response.choices else ""
+        message = response.choices[0].message if response.choices else None
+        content = message.content if message is not None else ""
+        if message is not None and message.tool_calls:
+            content = message.model_dump(exclude_none=True)
         usage = response.usage
+        usage_dict = usage.model_dump() if usage else {}
+        prompt_cached = cached_tokens(usage_dict)
+        # Coalesced callers shared the leader's upstream call, and its cost.
+        cost = charge_cost(model, g.tenant, usage_dict) if usage and not coalesced_call else 0.0
+        if usage:
+            context_guard.estimator.observe(model, token_base, usage.prompt_tokens)
+        if usage and g.get("ticket"):
+            g.ticket.charge(usage.completion_tokens)
+        if usage and not coalesced_call:
+            count_tokens(model_label(model), usage.prompt_tokens, usage.completion_tokens, prompt_cached)
+            if usage.completion_tokens:
+                metrics.TOKENS_PER_SECOND.labels(model_label(model), "false").observe(
+                    usage.completion_tokens / max(duration_ms / 1000, 1e-3))
 
         # Log to Braintrust
         try:
-            logger = get_logger()
-            logger.log(
+            logged = submit_trace(
+                "/v1/chat/completions",
                 input=messages,
                 output=content,
                 metrics={
                     "prompt_tokens": usage.prompt_tokens if usage else 0,
                     "completion_tokens": usage.completion_tokens if usage else 0,
                     "total_tokens": usage.total_tokens if usage else 0,
+                    "prompt_cached_tokens": prompt_cached,
+                    "cost_usd": cost,
                     "duration_ms": duration_ms,
+                    "queue_ms": g.queue_ms,
                 },
                 metadata={
                     "model": model,
-                    "temperature": kwargs.get("temperature"),
-                    "max_tokens": kwargs.get("max_tokens"),
-                    "provider": "openrouter",
+                    "tenant": g.tenant,
+                    "provider": route["upstream"],
+                    "upstream_attempts": route["attempts"],
+                    "hedged": route["hedged"],
                     "stream": False,
+                    "cached": False,
+                    "coalesced": coalesced_call,
+                    **trace_params(kwargs),
+                    **preflight,
                 },
             )
-            braintrust.flush()
-            print(f"[Braintrust] Logged chat completion: {model}", file=sys.stderr)
+            if logged:
+                print(f"[Braintrust] Queued chat completion: {model}", file=sys.stderr)
         except Exception as log_err:
             print(f"[Braintrust] Log error: {log_err}", file=sys.stderr)
 
-        return jsonify(response.model_dump())
+        resp = Response(body, mimetype="application/json")
+        if cache_key:
+            if cache_write and response.choices and not coalesced_call:
+                await response_cache.set(cache_key, body)
+            resp.headers["X-Proxy-Cache"] = "MISS"
+        return resp
 
+    except BudgetExceeded as e:
+        return budget_exceeded_response(e)
+    except ContextLimitExceeded as e:
+        return context_length_response(e)
+    except Rejected as e:
+        return rate_limited_response(e)
+    except CircuitOpen as e:
+        return circuit_open_response(e)
     except Exception as e:
         print(f"[Proxy] Error: {e}", file=sys.stderr)
+        data = await request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+        submit_trace("/v1/chat/completions", input=data.get("messages"), output=None, error=str(e),
+                     metadata={"model": g.get("model"), "tenant": g.get("tenant")})
+        if isinstance(e, APIStatusError):
+            return upstream_error_response(e)
         return jsonify({"error": {"message": str(e), "type": "proxy_error"}}), 500
 
 
-def stream_chat_completion(messages, model, **kwargs):
-    """Handle streaming chat completions."""
-    def generate():
-        full_content = ""
-        start_time = time.time()
+def cached_chat_completion(cached, messages, model, stream, start_time, kwargs):
+    """Serve a cache hit (replayed as SSE for stream callers) and log it."""
+    completion = codec.loads(cached)
+    choices = completion.get("choices") or [{}]
+    try:
+        if submit_trace(
+            "/v1/chat/completions",
+            input=messages,
+            output=(choices[0].get("message") or {}).get("content"),
+            metrics={"duration_ms": (time.time() - start_time) * 1000, "cost_usd": 0.0},
+            metadata={"model": model, "tenant": g.tenant, "provider": "cache", "stream": stream, "cached": True,
+                      **trace_params(kwargs)},
+        ):
+            print(f"[Braintrust] Queued cached completion: {model}", file=sys.stderr)
+    except Exception as log_err:
+        print(f"[Braintrust] Cache log error: {log_err}", file=sys.stderr)
+
+    headers = {"X-Proxy-Cache": "HIT"}
+    if stream:
+        return Response(completion_events(completion), mimetype="text/event-stream", headers=headers)
+    return Response(cached, mimetype="application/json", headers=headers)
+
+
+async def stream_chat_completion(messages, model, cache_key=None, client_usage=False, preflight=None,
+                                 token_base=0, upstream_messages=None, params=None):
+    """Handle streaming chat completions (upstream SSE bytes passed through as-is).
+
+    The upstream stream is opened before the response starts, so an open
+    breaker or an upstream error is a real HTTP status, not an SSE error.
+    Usage is always requested upstream so the trace gets token counts; the
+    usage-only final chunk is forwarded only if the client asked for it.
+    """
+    start_time = time.time()
+    started = time.monotonic()
+    label = model_label(model)
 
+    async def open_stream(client, upstream_model):
+        # Enter the streaming context here so failover covers everything
+        # up to the response headers; no bytes have reached the client yet.
+        return await client.chat.completions.with_streaming_response.create(
+            model=upstream_model,
+            messages=upstream_messages or messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            extra_body=params,
+        ).__aenter__()
+
+    upstream, route = await routed(model, open_stream, "chat_stream")
+    metrics.UPSTREAM_LATENCY.labels("/v1/chat/completions", label).observe(time.monotonic() - started)
+    # The stream holds the admission slot until it ends, not the handler.
+    ticket = g.pop("ticket", None)
+    tenant, queue_ms = g.get("tenant"), g.get("queue_ms", 0.0)
+
+    def log_trace(tap, aborted=False, error=None):
+        usage = tap.usage
+        if (aborted or error) and not usage:
+            # Usage only arrives with the last chunk; estimate what was consumed
+            # so far (one generated token per content chunk).
+            prompt_tokens = preflight["prompt_tokens_estimated"] if preflight else 0
+            completion_tokens = len(tap.gaps) + 1 if tap.first_token_at is not None else 0
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+        if tap.usage:
+            context_guard.estimator.observe(model, token_base, tap.usage.get("prompt_tokens"))
+        stream_metrics = observe_stream(tap, label, started, usage)
+        # Aborted streams are billed for what was generated, so charge the estimate.
+        stream_metrics["cost_usd"] = charge_cost(model, tenant, usage)
         try:
-            stream = openrouter.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=True,
-                **kwargs
+            duration_ms = (time.time() - start_time) * 1000
+            error = error or (tap.error and json.dumps(tap.error))
+            logged = submit_trace(
+                "/v1/chat/completions",
+                keep=aborted,
+                input=messages,
+                output=tap.content,
+                error=error,
+                metrics={"duration_ms": duration_ms, "queue_ms": queue_ms, **stream_metrics},
+                metadata={"model": model, "tenant": tenant, "stream": True, "provider": route["upstream"],
+                          "upstream_attempts": route["attempts"], "cached": False, "aborted": aborted,
+                          "usage_estimated": usage is not tap.usage, **(preflight or {}), **trace_params(params or {})},
             )
+            if logged:
+                print(f"[Braintrust] Queued {'aborted' if aborted else 'streaming'} completion: {model}", file=sys.stderr)
+        except Exception as log_err:
+            print(f"[Braintrust] Stream log error: {log_err}", file=sys.stderr)
+        return usage or {}
 
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    full_content += chunk.choices[0].delta.content
-                yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+    async def generate():
+        tap = SSETap(strip_usage=not client_usage)
+        in_flight = metrics.STREAMS_IN_FLIGHT.labels(label)
+        in_flight.inc()
+        usage = None
 
-            yield "data: [DONE]\n\n"
+        try:
+            try:
+                async for data in upstream.iter_bytes():
+                    for event in tap.feed(data):
+                        yield event
+            finally:
+                # Also runs when the client disconnects: closing the upstream
+                # response drops its connection, so upstream stops generating.
+                await upstream.close()
+            for event in tap.close():
+                yield event
+
+            if not tap.done:
+                yield b"data: [DONE]\n\n"
 
             # Log to Braintrust after streaming completes
-            try:
-                duration_ms = (time.time() - start_time) * 1000
-                logger = get_logger()
-                logger.log(
-                    input=messages,
-                    output=full_content,
-                    metrics={"duration_ms": duration_ms},
-                    metadata={"model": model, "stream": True, "provider": "openrouter", **kwargs},
-                )
-                braintrust.flush()
-                print(f"[Braintrust] Logged streaming completion: {model}", file=sys.stderr)
-            except Exception as log_err:
-                print(f"[Braintrust] Stream log error: {log_err}", file=sys.stderr)
+            usage = log_trace(tap)
+
+            # Cache only clean, complete text answers.
+            if cache_key and tap.done and tap.finish_reason == "stop" and tap.error is None:
+                await response_cache.set(cache_key, codec.dumps(tap.completion()))
+        except (asyncio.CancelledError, GeneratorExit):
+            # Quart cancels the response task (or closes this generator) when
+            # the client disconnects.
+            if usage is None:
+                metrics.ABORTED_STREAMS.labels(label).inc()
+                print(f"[Proxy] Client disconnected mid-stream: {model} ({len(tap.parts)} deltas sent)", file=sys.stderr)
+                usage = log_trace(tap, aborted=True)
+            raise
         except Exception as e:
             print(f"[Proxy] Stream error: {e}", file=sys.stderr)
+            if usage is None:
+                usage = log_trace(tap, error=str(e))
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            in_flight.dec()
+            if ticket is not None:
+                ticket.charge((usage or tap.usage or {}).get("completion_tokens"))
+                ticket.release()
 
     return Response(generate(), mimetype="text/event-stream")
 
 
+def count_tokens(label, prompt_tokens, completion_tokens, prompt_cached=0):
+    metrics.TOKENS.labels(label, "prompt").inc(prompt_tokens or 0)
+    metrics.TOKENS.labels(label, "completion").inc(completion_tokens or 0)
+    metrics.TOKENS.labels(label, "cached").inc(prompt_cached or 0)
+    if prompt_cache is not None:
+        prompt_cache.observe(label, prompt_tokens, prompt_cached)
+
+
+def observe_stream(tap, label, started, usage=None):
+    """Record usage and timing for a finished stream; returns Braintrust metrics.
+
+    TTFT separates queueing + prefill from decode; the inter-chunk gaps and
+    decode rate describe the decode phase alone.
+    """
+    usage = usage or tap.usage or {}
+    result = {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "prompt_cached_tokens": cached_tokens(usage),
+    }
+    count_tokens(label, result["prompt_tokens"], result["completion_tokens"], result["prompt_cached_tokens"])
+    if tap.first_token_at is None:
+        return result
+
+    ttft = tap.first_token_at - started
+    metrics.TTFT.labels(label).observe(ttft)
+    result["time_to_first_token"] = ttft  # seconds, Braintrust's built-in metric name
+    if tap.gaps:
+        inter_token = metrics.INTER_TOKEN.labels(label)
+        for gap in tap.gaps:
+            inter_token.observe(gap)
+        gaps = sorted(tap.gaps)
+        result["itl_p50_ms"] = gaps[len(gaps) // 2] * 1000
+        result["itl_p95_ms"] = gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))] * 1000
+        result["itl_max_ms"] = gaps[-1] * 1000
+
+    # Tokens after the first over the time spent producing them; chunk count
+    # stands in for tokens if upstream sent no usage.
+    decode_time = tap.last_token_at - tap.first_token_at
+    decode_tokens = (result["completion_tokens"] or len(tap.gaps) + 1) - 1
+    if decode_time > 0 and decode_tokens > 0:
+        rate = decode_tokens / decode_time
+        metrics.TOKENS_PER_SECOND.labels(label, "true").observe(rate)
+        result["decode_tokens_per_second"] = rate
+    return result
+
+
+async def fetch_embeddings(model, inputs):
+    """Embed `inputs` upstream; returns (float32 bytes per input, prompt tokens, upstream name).
+
+    Vectors are asked for as base64 and only base64-decoded: no SDK models
+    or float lists in between.
+    """
+    async def create(client, upstream_model):
+        return await client.embeddings.with_raw_response.create(
+            model=upstream_model, input=inputs, encoding_format="base64")
+
+    with metrics.UPSTREAM_LATENCY.labels("/v1/embeddings", model_label(model)).time():
+        raw, route = await routed(model, create, "embeddings", hedge=True)
+    body = codec.loads(raw.content)
+    vectors = [None] * len(inputs)
+    for item in body["data"]:
+        vectors[item["index"]] = decode_embedding(item["embedding"])
+    return vectors, (body.get("usage") or {}).get("prompt_tokens") or 0, route["upstream"]
+
+
+# Merge concurrent embedding requests for the same model into one upstream
+# call. EMBED_BATCH_MAX_WAIT_MS=0 disables batching.
+embedding_batcher = None
+if float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5)) > 0:
+    embedding_batcher = EmbeddingBatcher(
+        fetch_embeddings,
+        max_wait=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5)) / 1000,
+        max_items=int(os.getenv("EMBED_BATCH_MAX_ITEMS", 256)),
+        max_tokens=int(os.getenv("EMBED_BATCH_MAX_TOKENS", 60000)),
+    )
+
+
+async def upstream_embed(model, inputs):
+    """Send inputs upstream, through the micro-batcher when enabled."""
+    if embedding_batcher is not None:
+        return await embedding_batcher.submit(model, inputs)
+    return await fetch_embeddings(model, inputs)
+
+
+async def embed(model, inputs):
+    """Embed a list of inputs, answering repeated texts from the embedding cache.
+
+    Returns (float32 bytes per input, upstream prompt tokens, cache hits,
+    upstream name or None when everything came from the cache).
+    """
+    if embedding_cache is None or not all(isinstance(text, str) for text in inputs):
+        vectors, tokens, provider = await upstream_embed(model, inputs)
+        return vectors, tokens, 0, provider
+
+    vectors = await asyncio.to_thread(embedding_cache.get_many, model, inputs)
+    hits = sum(1 for vec in vectors if vec is not None)
+    missing = list(dict.fromkeys(text for text, vec in zip(inputs, vectors) if vec is None))
+    tokens, provider = 0, None
+    if missing:
+        fresh, tokens, provider = await upstream_embed(model, missing)
+        await asyncio.to_thread(embedding_cache.put_many, model, list(zip(missing, fresh)))
+        by_text = dict(zip(missing, fresh))
+        vectors = [vec if vec is not None else by_text[text] for text, vec in zip(inputs, vectors)]
+    return vectors, tokens, hits, provider
+
+
 @app.route("/v1/embeddings", methods=["POST"])
-def embeddings():
+async def embeddings():
     """Proxy embeddings with Braintrust tracing."""
     try:
-        data = request.json
+        data = await request_object()
+        if data is None:
+            return invalid_body_response()
         input_text = data.get("input", "")
         model = data.get("model", "text-embedding-ada-002")
+        encoding_format = data.get("encoding_format") or "float"
+        if not isinstance(model, str) or not model:
+            return invalid_param_response("'model' must be a non-empty string", "model")
+        g.model = model
+        if not isinstance(input_text, (str, list)):
+            return invalid_param_response("'input' must be a string or an array", "input")
+        if encoding_format not in EMBEDDING_FORMATS:
+            return invalid_param_response(f"Unsupported encoding_format {encoding_format!r}; use one of "
+                                          f"{', '.join(EMBEDDING_FORMATS)}", "encoding_format")
+        # A string or a single token array is one input; a list of either is a batch.
+        if isinstance(input_text, str) or (input_text and isinstance(input_text[0], int)):
+            inputs = [input_text]
+        else:
+            inputs = input_text
 
+        # Embedding models aren't interchangeable (dimensions differ): no downgrade.
+        budget_action = budgets.check(g.tenant, model, downgrade=False)[1]
+        await admit(sum(estimate_tokens(item) for item in inputs))
         start_time = time.time()
-        response = openrouter.embeddings.create(model=model, input=input_text)
+        vectors, prompt_tokens, cache_hits, provider = await embed(model, inputs)
         duration_ms = (time.time() - start_time) * 1000
+        cost = charge_cost(model, g.tenant, {"prompt_tokens": prompt_tokens}, requests=1 if provider else 0)
 
         # Log to Braintrust
         try:
-            logger = get_logger()
-            logger.log(
-                input=input_text if isinstance(input_text, str) else f"[{len(input_text)} texts]",
-                output=f"[{len(response.data)} embeddings]",
+            logged = submit_trace(
+                "/v1/embeddings",
+                input=input_text if isinstance(input_text, str) else f"[{len(inputs)} texts]",
+                output=f"[{len(vectors)} embeddings]",
                 metrics={
-                    "total_tokens": response.usage.total_tokens if response.usage else 0,
+                    "total_tokens": prompt_tokens,
                     "duration_ms": duration_ms,
+                    "cache_hits": cache_hits,
+                    "cost_usd": cost,
+                    "queue_ms": g.queue_ms,
                 },
-                metadata={"model": model, "provider": "openrouter", "type": "embedding"},
+                metadata={"model": model, "tenant": g.tenant, "provider": provider or "cache", "type": "embedding",
+                          "encoding_format": encoding_format, "budget": budget_action},
             )
-            braintrust.flush()
-            print(f"[Braintrust] Logged embeddings: {model}", file=sys.stderr)
+            if logged:
+                print(f"[Braintrust] Queued embeddings: {model}", file=sys.stderr)
         except Exception as log_err:
             print(f"[Braintrust] Embeddings log error: {log_err}", file=sys.stderr)
 
-        return jsonify(response.model_dump())
+        return Response(embeddings_body(vectors, model, prompt_tokens, encoding_format), mimetype="application/json")
 
+    except BudgetExceeded as e:
+        return budget_exceeded_response(e)
+    except Rejected as e:
+        return rate_limited_response(e)
+    except CircuitOpen as e:
+        return circuit_open_response(e)
     except Exception as e:
         print(f"[Proxy] Embeddings error: {e}", file=sys.stderr)
+        data = await request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+        input_text = data.get("input")
+        if not isinstance(input_text, str):
+            input_text = f"[{len(input_text)} texts]" if isinstance(input_text, list) else None
+        submit_trace("/v1/embeddings", input=input_text,
+                     output=None, error=str(e), metadata={"model": g.get("model"), "tenant": g.get("tenant"), "type": "embedding"})
+        if isinstance(e, APIStatusError):
+            return upstream_error_response(e)
         return jsonify({"error": {"message": str(e), "type": "proxy_error"}}), 500
 
 
+# Other /v1/* routes on the allowlist go to the default upstream with both
+# bodies streamed unparsed. They run on the proxy's upstream key, so account,
+# key and credits endpoints stay off unless PASSTHROUGH_ROUTES="*" opts in.
+# PASSTHROUGH_ROUTES="" disables it.
+DEFAULT_PASSTHROUGH_ROUTES = "completions,responses,responses/*,moderations,rerank"
+passthrough_routes = [p.strip() for p in os.getenv("PASSTHROUGH_ROUTES", DEFAULT_PASSTHROUGH_ROUTES).split(",")
+                      if p.strip()]
+PASSTHROUGH_CAPTURE_BYTES = int(os.getenv("PASSTHROUGH_CAPTURE_BYTES", 65536))
+
+
+@app.route("/v1/<path:path>", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def passthrough(path):
+    """Forward any other OpenAI-compatible call byte-for-byte, tracing it on the side."""
+    route = "/v1/" + path
+    if not any(fnmatch.fnmatchcase(path, pattern) for pattern in passthrough_routes):
+        body = {"error": {"message": f"Unknown route {route}", "type": "invalid_request_error",
+                          "code": "unknown_route", "param": None}}
+        return jsonify(body), 404
+    try:
+        # The model isn't known without parsing the body: only hard budgets apply.
+        budgets.check(g.tenant, "", downgrade=False)
+        await admit(0)
+    except BudgetExceeded as e:
+        return budget_exceeded_response(e)
+    except Rejected as e:
+        return rate_limited_response(e)
+
+    start_time = time.time()
+    started = time.monotonic()
+    upstream = router.default
+    request_tap = BodyTap(request.headers.get("Content-Type"), PASSTHROUGH_CAPTURE_BYTES,
+                          request.headers.get("Content-Encoding"))
+
+    async def request_body():
+        async for chunk in request.body:
+            yield request_tap.feed(chunk)
+
+    has_body = request.headers.get("Content-Length", "0") != "0" or "Transfer-Encoding" in request.headers
+    url = upstream.client.base_url.join(path).copy_with(query=request.query_string or None)
+    http_request = upstream.http_client.build_request(
+        request.method, url, headers=request_headers(request.headers, upstream.client.api_key),
+        content=request_body() if has_body else None)
+    try:
+        upstream_response = await upstream.http_client.send(http_request, stream=True)
+    except httpx.HTTPError as e:
+        upstream.record("passthrough", time.monotonic() - started, error=True)
+        print(f"[Proxy] Pass-through error: {route}: {e}", file=sys.stderr)
+        submit_trace(route, input=request_tap.summary(), output=None, error=str(e),
+                     metadata={"model": None, "tenant": g.tenant, "provider": upstream.name, "passthrough": True})
+        body = {"error": {"message": f"Upstream request failed: {e}", "type": "upstream_error", "param": None}}
+        return jsonify(body), 502
+    status = upstream_response.status_code
+    upstream.record("passthrough", time.monotonic() - started, error=status in (408, 429) or status >= 500)
+
+    # The response body outlives the handler; so does the admission slot.
+    ticket = g.pop("ticket", None)
+    tenant, queue_ms, method = g.tenant, g.queue_ms, request.method
+    content_type = upstream_response.headers.get("Content-Type", "")
+    headers = response_headers(upstream_response.headers)
+    stream_tap = SSETap() if content_type.startswith("text/event-stream") else None
+    if stream_tap is not None:
+        # Events are split on decoded bytes, so send them decoded.
+        headers = [(key, value) for key, value in headers if key.lower() != "content-encoding"]
+    response_tap = BodyTap(content_type, PASSTHROUGH_CAPTURE_BYTES,
+                           None if stream_tap is not None else upstream_response.headers.get("Content-Encoding"))
+
+    def log_trace(aborted=False, error=None):
+        request_json = request_tap.json()
+        response_json = response_tap.json() if stream_tap is None else None
+        model = ((request_json if isinstance(request_json, dict) else {}).get("model")
+                 or (response_json if isinstance(response_json, dict) else {}).get("model")
+                 or (stream_tap.model if stream_tap is not None else None))
+        usage = stream_tap.usage if stream_tap is not None else (
+            response_json.get("usage") if isinstance(response_json, dict) else None)
+        trace_metrics = {"duration_ms": (time.time() - start_time) * 1000, "queue_ms": queue_ms,
+                         "request_bytes": request_tap.size, "response_bytes": response_tap.size}
+        if isinstance(usage, dict):
+            for key, value in usage.items():
+                if isinstance(value, (int, float)) and key != "cost":
+                    trace_metrics[key] = value
+            if model:
+                trace_metrics["cost_usd"] = charge_cost(model, tenant, usage)
+        try:
+            submit_trace(
+                route,
+                keep=aborted,
+                input=request_tap.summary(),
+                output=stream_tap.content if stream_tap is not None else response_tap.summary(),
+                error=error or (f"HTTP {status}" if status >= 400 else None),
+                metrics=trace_metrics,
+                metadata={"model": model, "tenant": tenant, "provider": upstream.name, "passthrough": True,
+                          "method": method, "status": status, "stream": stream_tap is not None,
+                          "aborted": aborted},
+            )
+        except Exception as log_err:
+            print(f"[Braintrust] Pass-through log error: {log_err}", file=sys.stderr)
+
+    async def generate():
+        logged = False
+        try:
+            try:
+                if stream_tap is None:
+                    async for data in upstream_response.aiter_raw():
+                        yield response_tap.feed(data)
+                else:
+                    async for data in upstream_response.aiter_bytes():
+                        for event in stream_tap.feed(response_tap.feed(data)):
+                            yield event
+                    for event in stream_tap.close():
+                        yield event
+            finally:
+                await upstream_response.aclose()
+            logged = True
+            log_trace()
+        except (asyncio.CancelledError, GeneratorExit):
+            if not logged:
+                logged = True
+                log_trace(aborted=True)
+            raise
+        except Exception as e:
+            # Headers are out; dropping the connection is the only way to say so.
+            print(f"[Proxy] Pass-through stream error: {route}: {e}", file=sys.stderr)
+            if not logged:
+                logged = True
+                log_trace(error=str(e))
+            raise
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    return Response(generate(), status=status, headers=headers)
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     print(f"🧠 Braintrust Proxy running on port {port}")
@@ -0,0 +1,146 @@
+"""
+Cross-request micro-batching for embedding calls.
+
+Bulk ingests arrive as bursts of small /v1/embeddings requests. The batcher
+holds each one for up to `max_wait` seconds, merges inputs for the same model
+into a single upstream call (bounded by item and estimated-token limits) and
+hands every waiting caller its own slice of the result. If upstream rejects
+a merged call outright (a non-retryable 4xx, e.g. one over-long text), each
+caller's inputs are re-sent on their own so only the bad request fails.
+"""
+import asyncio
+import sys
+
+from metrics import EMBEDDING_BATCH_FILL
+from router import retryable
+
+FILL_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0)
+
+
+def estimate_tokens(item):
+    """Rough token count: token arrays are exact, text is ~4 chars/token."""
+    if isinstance(item, str):
+        return len(item) // 4 + 1
+    return len(item)
+
+
+class _Batch:
+    def __init__(self):
+        self.inputs = []
+        self.waiters = []  # (offset, count, est_tokens, future)
+        self.tokens = 0
+        self.timer = None
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent `fetch(model, inputs)` calls per model."""
+
+    def __init__(self, fetch, max_wait=0.005, max_items=256, max_tokens=60000):
+        self._fetch = fetch
+        self._pending = {}
+        self._tasks = set()
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self.splits = 0
+        self.fill_sum = 0.0
+        self.fill_counts = [0] * len(FILL_BUCKETS)
+
+    async def submit(self, model, inputs):
+        """Embed `inputs` as part of a shared batch; returns `fetch`'s tuple with
+        this caller's vectors and share of the prompt tokens."""
+        tokens = sum(estimate_tokens(item) for item in inputs)
+        if not inputs or len(inputs) >= self.max_items or tokens >= self.max_tokens:
+            # Already a full batch on its own (or empty, for upstream to answer).
+            return await self._fetch(model, inputs)
+
+        # Text and token-array inputs can't share an upstream call.
+        key = (model, isinstance(inputs[0], str))
+        batch = self._pending.get(key)
+        if batch and (len(batch.inputs) + len(inputs) > self.max_items or batch.tokens + tokens > self.max_tokens):
+            self._dispatch(key, batch)
+            batch = None
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch, key, batch)
+
+        future = asyncio.get_running_loop().create_future()
+        batch.waiters.append((len(batch.inputs), len(inputs), tokens, future))
+        batch.inputs.extend(inputs)
+        batch.tokens += tokens
+        if len(batch.inputs) >= self.max_items or batch.tokens >= self.max_tokens:
+            self._dispatch(key, batch)
+        return await future
+
+    def _dispatch(self, key, batch):
+        if self._pending.get(key) is not batch:
+            return  # already sent (filled up before its timer fired)
+        del self._pending[key]
+        batch.timer.cancel()
+        self._record(batch)
+        task = asyncio.ensure_future(self._run(key[0], batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, model, batch):
+        try:
+            vectors, prompt_tokens, *extra = await self._fetch(model, batch.inputs)
+        except Exception as e:
+            print(f"[Batcher] Upstream error for {len(batch.waiters)} requests: {e}", file=sys.stderr)
+            if len(batch.waiters) > 1 and not retryable(e):
+                await self._run_alone(model, batch)
+                return
+            for *_, future in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Split usage across callers in proportion to their estimated tokens.
+        remaining = prompt_tokens
+        for i, (offset, count, est_tokens, future) in enumerate(batch.waiters):
+            if i == len(batch.waiters) - 1:
+                share = remaining
+            else:
+                share = round(prompt_tokens * est_tokens / max(batch.tokens, 1))
+                remaining -= share
+            if not future.done():
+                future.set_result((vectors[offset:offset + count], share, *extra))
+
+    async def _run_alone(self, model, batch):
+        """Re-send each waiter's inputs as its own call, so an error reaches only its caller."""
+        async def one(offset, count, future):
+            try:
+                result = await self._fetch(model, batch.inputs[offset:offset + count])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+        self.splits += 1
+        await asyncio.gather(*(one(offset, count, future) for offset, count, _, future in batch.waiters))
+
+    def _record(self, batch):
+        fill = len(batch.inputs) / self.max_items
+        self.batches += 1
+        self.requests += len(batch.waiters)
+        self.items += len(batch.inputs)
+        self.fill_sum += fill
+        EMBEDDING_BATCH_FILL.observe(fill)
+        for i, bound in enumerate(FILL_BUCKETS):
+            if fill <= bound:
+                self.fill_counts[i] += 1
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "items": self.items,
+            "splits": self.splits,
+            "mean_fill": round(self.fill_sum / self.batches, 3) if self.batches else 0.0,
+            "fill_le": dict(zip((str(b) for b in FILL_BUCKETS), self.fill_counts)),
+            "pending": sum(len(b.waiters) for b in self._pending.values()),
+        }
@@ -0,0 +1,116 @@
+"""
+Benchmark: embedding response encoding, old path vs packed bytes.
+
+Old path: the SDK asks upstream for base64, decodes it into a
+CreateEmbeddingResponse of float lists, the proxy packs each list into
+float32 bytes (for the cache) and answers with jsonify'd float lists. New
+path: the raw upstream JSON is loaded, only the base64 is decoded, and the
+response is assembled from the bytes in the client's `encoding_format`.
+
+Reports proxy CPU time per request, client decode time and response size
+for each format.
+
+Usage: python bench/embedding_encoding.py [--texts 256] [--dimensions 1536] [--runs 5]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+from openai._models import construct_type
+from openai.types import CreateEmbeddingResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from vectors import decode_embedding, embeddings_body  # noqa: E402
+
+
+def make_upstream_body(texts, dimensions):
+    """An upstream /v1/embeddings answer with base64 float32 vectors."""
+    rng = random.Random(0)
+    data = [{"object": "embedding", "index": i,
+             "embedding": base64.b64encode(array("f", (rng.uniform(-1, 1) for _ in range(dimensions))).tobytes()).decode()}
+            for i in range(texts)]
+    return json.dumps({"object": "list", "data": data, "model": "bench/embed",
+                       "usage": {"prompt_tokens": texts * 8, "total_tokens": texts * 8}}).encode()
+
+
+def old_path(raw):
+    # As the SDK builds responses: nested models, no validation.
+    response = construct_type(type_=CreateEmbeddingResponse, value=json.loads(raw))
+    for item in response.data:  # the SDK's own base64 -> float list step
+        item.embedding = array("f", base64.b64decode(item.embedding)).tolist()
+    vectors = [array("f", item.embedding).tobytes() for item in response.data]
+    return json.dumps({
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": array("f", vec).tolist()}
+                 for i, vec in enumerate(vectors)],
+        "model": response.model,
+        "usage": {"prompt_tokens": response.usage.prompt_tokens, "total_tokens": response.usage.total_tokens},
+    }).encode()
+
+
+def new_path(raw, encoding_format):
+    body = json.loads(raw)
+    vectors = [decode_embedding(item["embedding"]) for item in body["data"]]
+    return embeddings_body(vectors, body["model"], body["usage"]["prompt_tokens"], encoding_format)
+
+
+def client_decode(body, encoding_format):
+    """What a client does to get float vectors out of the response."""
+    data = json.loads(body)["data"]
+    if encoding_format == "float":
+        return [item["embedding"] for item in data]
+    if encoding_format == "base64":
+        return [array("f", base64.b64decode(item["embedding"])) for item in data]
+    out = []
+    for item in data:
+        raw = base64.b64decode(item["embedding"])
+        out.append(struct.unpack(f"<{len(raw) // 2}e", raw))
+    return out
+
+
+def measure(fn, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = make_upstream_body(args.texts, args.dimensions)
+    old_body = old_path(raw)
+    old_s = measure(lambda: old_path(raw), args.runs)
+    result = {
+        "texts": args.texts,
+        "dimensions": args.dimensions,
+        "upstream_bytes": len(raw),
+        "old": {"proxy_cpu_ms": round(old_s * 1000, 2), "response_bytes": len(old_body),
+                "client_decode_ms": round(measure(lambda: client_decode(old_body, "float"), args.runs) * 1000, 2)},
+    }
+    for encoding_format in ("float", "base64", "float16"):
+        body = new_path(raw, encoding_format)
+        new_s = measure(lambda: new_path(raw, encoding_format), args.runs)
+        result[encoding_format] = {
+            "proxy_cpu_ms": round(new_s * 1000, 2),
+            "response_bytes": len(body),
+            "client_decode_ms": round(measure(lambda: client_decode(body, encoding_format), args.runs) * 1000, 2),
+            "speedup": round(old_s / new_s, 1),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Fake OpenAI-compatible upstream for benchmarks and local testing.
+
+Serves /v1/models, /v1/chat/completions (streamed or not) and
+/v1/embeddings. A request found in the cassette (same path, model and
+messages/input) replays the recorded answer; anything else gets a
+synthesized one. Streams are paced by --ttft-ms and --tokens-per-second
+(one content chunk per token), and --error-rate answers that fraction of
+calls with --error-status instead.
+
+With --record URL, requests missing from the cassette are sent to a real
+upstream (key from $RECORD_API_KEY or $OPENROUTER_API_KEY) and appended to
+the cassette, so it can be captured once and replayed offline.
+
+Usage: python bench/fake_upstream.py [--port 9100] [--cassette bench/chat.jsonl]
+                                     [--ttft-ms 300] [--tokens-per-second 50] [--tokens 200]
+                                     [--error-rate 0] [--error-status 500] [--record URL]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+
+import httpx
+from quart import Quart, Response, jsonify, request
+
+
+def cassette_key(path, body):
+    """Requests match on path, model and messages/input (not sampling params or `stream`)."""
+    key = {"path": path, "model": body.get("model"), "messages": body.get("messages"), "input": body.get("input")}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def load_cassette(path):
+    entries = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+    return entries
+
+
+def completion_from_chunks(chunks):
+    """Fold recorded stream chunks into one chat.completion body."""
+    content, finish_reason, usage = [], "stop", None
+    for chunk in chunks:
+        for choice in chunk.get("choices") or []:
+            content.append((choice.get("delta") or {}).get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+        usage = chunk.get("usage") or usage
+    first = chunks[0] if chunks else {}
+    return {
+        "id": first.get("id", "gen-fake"), "object": "chat.completion", "created": first.get("created", 0),
+        "model": first.get("model"), "usage": usage,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)},
+                     "finish_reason": finish_reason}],
+    }
+
+
+def chunks_from_completion(completion):
+    """Split a chat.completion into one stream chunk per word, plus a usage chunk."""
+    base = {"id": completion.get("id", "gen-fake"), "object": "chat.completion.chunk",
+            "created": completion.get("created", 0), "model": completion.get("model")}
+    choice = (completion.get("choices") or [{}])[0]
+    words = ((choice.get("message") or {}).get("content") or "").split(" ")
+    chunks = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": word} if i == 0 else {"content": " " + word},
+                                    "finish_reason": None}]} for i, word in enumerate(words)]
+    chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason", "stop")}]})
+    if completion.get("usage"):
+        chunks.append({**base, "choices": [], "usage": completion["usage"]})
+    return chunks
+
+
+def synthesize_completion(body, tokens):
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4 + 1
+    return {
+        "id": "gen-fake", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(f"tok{i % 97}" for i in range(tokens))},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens},
+    }
+
+
+def synthesize_embeddings(body, dimensions):
+    inputs = body.get("input")
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    data = []
+    for i, item in enumerate(inputs):
+        seed = int(hashlib.sha256(json.dumps(item).encode()).hexdigest()[:8], 16)
+        vector = [((seed * (j + 1)) % 1000) / 1000.0 for j in range(dimensions)]
+        if body.get("encoding_format") == "base64":
+            vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+        data.append({"object": "embedding", "index": i, "embedding": vector})
+    tokens = sum(len(item) // 4 + 1 if isinstance(item, str) else len(item) for item in inputs)
+    return {"object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+def create_app(args):
+    app = Quart(__name__)
+    app.config["RESPONSE_TIMEOUT"] = None
+    cassette = load_cassette(args.cassette)
+    stats = {"requests": 0, "errors_injected": 0, "replayed": 0, "synthesized": 0, "recorded": 0}
+    recorder = httpx.AsyncClient(timeout=300) if args.record else None
+
+    async def record(path, body):
+        api_key = os.getenv("RECORD_API_KEY") or os.getenv("OPENROUTER_API_KEY")
+        upstream = {**body, "stream": False}
+        upstream.pop("stream_options", None)
+        response = await recorder.post(args.record.rstrip("/") + path.removeprefix("/v1"), json=upstream,
+                                       headers={"Authorization": f"Bearer {api_key}"} if api_key else {})
+        response.raise_for_status()
+        entry = {"key": cassette_key(path, body), "path": path, "request": body, "response": response.json()}
+        cassette[entry["key"]] = entry
+        with open(args.cassette, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        stats["recorded"] += 1
+        return entry
+
+    async def lookup(path, body):
+        entry = cassette.get(cassette_key(path, body))
+        if entry is None and recorder is not None and args.cassette:
+            entry = await record(path, body)
+        elif entry is not None:
+            stats["replayed"] += 1
+        else:
+            stats["synthesized"] += 1
+        return entry
+
+    def inject_error():
+        if args.error_rate and random.random() < args.error_rate:
+            stats["errors_injected"] += 1
+            body = {"error": {"message": "Injected upstream error", "type": "server_error", "code": args.error_status}}
+            return jsonify(body), args.error_status
+        return None
+
+    @app.get("/v1/models")
+    async def models():
+        return jsonify({"data": [{"id": model, "context_length": 128000,
+                                  "pricing": {"prompt": "0.000001", "completion": "0.000002"}}
+                                 for model in ("fake/chat", "fake/embed")]})
+
+    @app.get("/stats")
+    async def get_stats():
+        return jsonify(stats)
+
+    @app.post("/v1/chat/completions")
+    async def chat():
+        stats["requests"] += 1
+        body = await request.get_json()
+        error = inject_error()
+        if error is not None:
+            return error
+        entry = await lookup("/v1/chat/completions", body)
+        if entry is None:
+            completion = synthesize_completion(body, args.tokens)
+        else:
+            completion = entry.get("response") or completion_from_chunks(entry["chunks"])
+
+        if not body.get("stream"):
+            tokens = (completion.get("usage") or {}).get("completion_tokens") or args.tokens
+            await asyncio.sleep(args.ttft_ms / 1000 + tokens / args.tokens_per_second)
+            return jsonify(completion)
+
+        chunks = entry["chunks"] if entry is not None and "chunks" in entry else chunks_from_completion(completion)
+        if not (body.get("stream_options") or {}).get("include_usage"):
+            chunks = [chunk for chunk in chunks if chunk.get("choices")]
+
+        async def generate():
+            await asyncio.sleep(args.ttft_ms / 1000)
+            interval = 1 / args.tokens_per_second
+            next_at = time.monotonic()
+            for chunk in chunks:
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield b"data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings():
+        stats["requests"] += 1
+        body = await request.get_json()
+        error = inject_error()
+        if error is not None:
+            return error
+        entry = await lookup("/v1/embeddings", body)
+        await asyncio.sleep(args.ttft_ms / 1000)
+        return jsonify(entry["response"] if entry is not None else synthesize_embeddings(body, args.dimensions))
+
+    @app.after_serving
+    async def close_recorder():
+        if recorder is not None:
+            await recorder.aclose()
+
+    return app
+
+
+def parser():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=9100)
+    p.add_argument("--cassette", help="JSONL file of recorded requests and responses")
+    p.add_argument("--record", metavar="URL", help="record cassette misses from this upstream base URL")
+    p.add_argument("--ttft-ms", type=float, default=300.0)
+    p.add_argument("--tokens-per-second", type=float, default=50.0)
+    p.add_argument("--tokens", type=int, default=200, help="completion length when synthesizing")
+    p.add_argument("--dimensions", type=int, default=1536, help="embedding size when synthesizing")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--error-status", type=int, default=500)
+    return p
+
+
+def main():
+    import uvicorn
+
+    args = parser().parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: JSON codec on typical proxy payloads, stdlib vs fast backend.
+
+For each payload the old path (stdlib `json`, and `json.dumps(model_dump())`
+for SDK responses) is timed against `codec` with each installed backend:
+
+- chat_request: decode a chat request (long system prompt, 20 turns, tools).
+- chat_response: encode a ChatCompletion model with tool calls to bytes.
+- stream_chunks: decode 1000 SSE chunk payloads, as the SSE tap does.
+- embedding_floats: encode a float `/v1/embeddings` answer (64 x 1536).
+
+Reports microseconds per operation (best of --runs, one core) and the
+speedup over the old path.
+
+Usage: python bench/json_codec.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from array import array
+
+from openai._models import construct_type
+from openai.types.chat import ChatCompletion
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import codec  # noqa: E402
+
+
+def chat_request():
+    tools = [{"type": "function", "function": {
+        "name": f"tool_{i}", "description": "Look something up in the workspace documents. " * 4,
+        "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "limit": {"type": "integer"}},
+                       "required": ["query"]}}} for i in range(8)]
+    messages = [{"role": "system", "content": "You are a helpful assistant for the Acme workspace. " * 150}]
+    for i in range(20):
+        messages.append({"role": "user", "content": f"Question {i}: how does the retention policy apply here? " * 5})
+        messages.append({"role": "assistant", "content": f"Answer {i}: the policy keeps records for seven years. " * 12})
+    return json.dumps({"model": "anthropic/claude-sonnet-4.5", "messages": messages, "tools": tools,
+                       "temperature": 0.7, "stream": False}).encode()
+
+
+def chat_response():
+    raw = {
+        "id": "gen-bench", "object": "chat.completion", "created": 1700000000, "model": "anthropic/claude-sonnet-4.5",
+        "provider": "Anthropic",
+        "choices": [{"index": 0, "finish_reason": "tool_calls", "native_finish_reason": "tool_use", "message": {
+            "role": "assistant", "content": "Let me check the documents. " * 40,
+            "tool_calls": [{"id": f"call_{i}", "type": "function",
+                            "function": {"name": f"tool_{i}", "arguments": json.dumps({"query": "retention " * 20})}}
+                           for i in range(4)]}}],
+        "usage": {"prompt_tokens": 9000, "completion_tokens": 400, "total_tokens": 9400,
+                  "prompt_tokens_details": {"cached_tokens": 8000}},
+    }
+    return construct_type(type_=ChatCompletion, value=raw)
+
+
+def stream_chunks(count=1000):
+    return [json.dumps({
+        "id": "gen-bench", "object": "chat.completion.chunk", "created": 1700000000,
+        "model": "anthropic/claude-sonnet-4.5", "provider": "Anthropic",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": f" tok{i % 97}"},
+                     "finish_reason": None, "native_finish_reason": None, "logprobs": None}],
+    }).encode() for i in range(count)]
+
+
+def embedding_floats(texts=64, dimensions=1536):
+    rng = random.Random(0)
+    return {"object": "list", "model": "bench/embed", "usage": {"prompt_tokens": 512, "total_tokens": 512},
+            "data": [{"object": "embedding", "index": i,
+                      "embedding": array("f", (rng.uniform(-1, 1) for _ in range(dimensions))).tolist()}
+                     for i in range(texts)]}
+
+
+def measure(fn, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    request_body = chat_request()
+    response = chat_response()
+    chunks = stream_chunks()
+    embeddings = embedding_floats()
+    cases = {
+        "chat_request": (lambda: json.loads(request_body), lambda: codec.loads(request_body)),
+        "chat_response": (lambda: json.dumps(response.model_dump()).encode(), lambda: codec.dump_model(response)),
+        "stream_chunks": (lambda: [json.loads(chunk) for chunk in chunks],
+                          lambda: [codec.loads(chunk) for chunk in chunks]),
+        "embedding_floats": (lambda: json.dumps(embeddings).encode(), lambda: codec.dumps(embeddings)),
+    }
+
+    result = {"backends": list(codec.BACKENDS)}
+    for case, (old, new) in cases.items():
+        old_s = measure(old, args.runs)
+        result[case] = {"old_us": round(old_s * 1e6, 1)}
+        for backend in codec.BACKENDS:
+            codec.select(backend)
+            new_s = measure(new, args.runs)
+            result[case][f"{backend}_us"] = round(new_s * 1e6, 1)
+            result[case][f"{backend}_speedup"] = round(old_s / new_s, 1)
+    codec.select()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Benchmark: latency, throughput and resources the proxy adds over its upstream.
+
+Starts bench/fake_upstream.py and the proxy (gunicorn with gunicorn.conf.py,
+Braintrust replaced by bench/sink_app.py), then runs the same chat load at
+--concurrency twice: straight at the fake upstream, then through the proxy.
+Overhead is proxy minus direct at each percentile. CPU and RSS come from
+/proc for the gunicorn master and workers (Linux only).
+
+Prints one JSON document (also written to --output). With --baseline, the
+overhead and per-stream costs are compared with an earlier result, and the
+exit status is 1 if any grew by more than --max-regression.
+
+Usage: python bench/proxy_overhead.py [--concurrency 50] [--requests 1000] [--workers 2]
+                                      [--ttft-ms 300] [--tokens-per-second 50] [--tokens 200]
+                                      [--no-stream] [--output result.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROXY_DIR = os.path.dirname(BENCH_DIR)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Lower is better for all of these.
+REGRESSION_KEYS = [("overhead", "ttft_p50_ms"), ("overhead", "ttft_p99_ms"),
+                   ("overhead", "total_p50_ms"), ("overhead", "total_p99_ms"),
+                   ("proxy_process", "cpu_ms_per_stream"), ("proxy_process", "rss_kb_per_stream")]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def process_tree(root):
+    """`root` and its direct children (gunicorn master + workers)."""
+    pids = [root]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == root:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return pids
+
+
+def cpu_seconds(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])  # utime + stime
+        except OSError:
+            continue
+    return total / CLOCK_TICKS
+
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+
+async def wait_ready(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def one_call(client, url, body, stream):
+    """(ttft seconds, total seconds, completion chunks) or raises on an error."""
+    started = time.monotonic()
+    if not stream:
+        response = await client.post(url, json=body)
+        response.raise_for_status()
+        elapsed = time.monotonic() - started
+        usage = response.json().get("usage") or {}
+        return elapsed, elapsed, usage.get("completion_tokens", 0)
+    ttft, chunks = None, 0
+    async with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and line != "data: [DONE]" and '"content"' in line:
+                chunks += 1
+                if ttft is None:
+                    ttft = time.monotonic() - started
+    return ttft or time.monotonic() - started, time.monotonic() - started, chunks
+
+
+async def run_load(base_url, args, pids=None):
+    """Drive `args.requests` chat calls at `args.concurrency`; returns latency/throughput stats."""
+    url = base_url.rstrip("/") + "/v1/chat/completions"
+    body = {"model": args.model, "stream": args.stream,
+            "messages": [{"role": "user", "content": "Benchmark prompt. " * 20}]}
+    ttfts, totals = [], []
+    tokens = errors = 0
+    remaining = args.requests
+    rss_peak = rss_bytes(pids) if pids else 0
+
+    async def worker(client):
+        nonlocal remaining, tokens, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                ttft, total, chunks = await one_call(client, url, body, args.stream)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            ttfts.append(ttft)
+            totals.append(total)
+            tokens += chunks
+
+    async def sample_rss():
+        nonlocal rss_peak
+        while True:
+            rss_peak = max(rss_peak, rss_bytes(pids))
+            await asyncio.sleep(0.1)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        sampler = asyncio.ensure_future(sample_rss()) if pids else None
+        cpu_before = cpu_seconds(pids) if pids else 0.0
+        started = time.monotonic()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        wall = time.monotonic() - started
+        cpu = cpu_seconds(pids) - cpu_before if pids else 0.0
+        if sampler is not None:
+            sampler.cancel()
+
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None  # noqa: E731
+    result = {
+        "completed": len(totals),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(totals) / wall, 2),
+        "tokens_per_s": round(tokens / wall, 1),
+        "ttft_p50_ms": ms(percentile(ttfts, 0.50)),
+        "ttft_p99_ms": ms(percentile(ttfts, 0.99)),
+        "total_p50_ms": ms(percentile(totals, 0.50)),
+        "total_p99_ms": ms(percentile(totals, 0.99)),
+    }
+    if pids:
+        result["_cpu_s"] = cpu
+        result["_rss_peak"] = rss_peak
+    return result
+
+
+def compare(result, baseline, max_regression):
+    """{metric: {baseline, current, change}} and whether anything regressed."""
+    report, regressed = {}, False
+    for section, key in REGRESSION_KEYS:
+        old = (baseline.get(section) or {}).get(key)
+        new = (result.get(section) or {}).get(key)
+        if old is None or new is None:
+            continue
+        # Overheads can be ~0; judge those by absolute change against a 1 ms floor.
+        change = (new - old) / max(abs(old), 1.0)
+        report[f"{section}.{key}"] = {"baseline": old, "current": new, "change": round(change, 3)}
+        regressed = regressed or change > max_regression
+    return report, regressed
+
+
+async def main_async(args):
+    upstream_port, proxy_port = args.upstream_port, args.proxy_port
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_upstream.py"), "--port", str(upstream_port),
+        "--ttft-ms", str(args.ttft_ms), "--tokens-per-second", str(args.tokens_per_second),
+        "--tokens", str(args.tokens), "--error-rate", str(args.error_rate),
+        *(["--cassette", args.cassette] if args.cassette else []),
+    ])
+    metrics_dir = tempfile.mkdtemp(prefix="proxy-bench-metrics-")
+    env = {
+        **os.environ,
+        "PORT": str(proxy_port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "UPSTREAMS": json.dumps({"upstreams": {"fake": {"base_url": f"http://127.0.0.1:{upstream_port}/v1",
+                                                        "api_key_env": "BENCH_UPSTREAM_KEY"}},
+                                 "routes": [{"model": "*", "upstreams": ["fake"]}]}),
+        "BENCH_UPSTREAM_KEY": "bench",
+        "BRAINTRUST_API_KEY": "bench",
+        "LOG_SPOOL_PATH": "",
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+    }
+    proxy = subprocess.Popen([
+        sys.executable, "-m", "gunicorn", "-c", os.path.join(PROXY_DIR, "gunicorn.conf.py"),
+        "--chdir", PROXY_DIR, "--pythonpath", BENCH_DIR, "--log-level", "warning", "sink_app:app",
+    ], env=env, stderr=subprocess.DEVNULL if not args.verbose else None)
+    try:
+        await wait_ready(f"http://127.0.0.1:{upstream_port}/v1/models")
+        await wait_ready(f"http://127.0.0.1:{proxy_port}/health")
+        # Warm both paths (connection pools, imports, catalog) before measuring.
+        warmup = argparse.Namespace(**{**vars(args), "requests": min(args.concurrency, 20)})
+        await run_load(f"http://127.0.0.1:{upstream_port}", warmup)
+        await run_load(f"http://127.0.0.1:{proxy_port}", warmup)
+
+        direct = await run_load(f"http://127.0.0.1:{upstream_port}", args)
+        pids = process_tree(proxy.pid)
+        rss_idle = rss_bytes(pids)
+        proxied = await run_load(f"http://127.0.0.1:{proxy_port}", args, pids)
+    finally:
+        proxy.terminate()
+        fake.terminate()
+        proxy.wait(30)
+        fake.wait(30)
+
+    cpu, rss_peak = proxied.pop("_cpu_s"), proxied.pop("_rss_peak")
+    completed = max(proxied["completed"], 1)
+    result = {
+        "benchmark": "proxy_overhead",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {key: getattr(args, key) for key in (
+            "concurrency", "requests", "workers", "stream", "ttft_ms", "tokens_per_second", "tokens",
+            "error_rate", "cassette")},
+        "direct": direct,
+        "proxy": proxied,
+        "overhead": {key: round(proxied[key] - direct[key], 2)
+                     for key in ("ttft_p50_ms", "ttft_p99_ms", "total_p50_ms", "total_p99_ms")
+                     if proxied[key] is not None and direct[key] is not None},
+        "proxy_process": {
+            "workers": args.workers,
+            "cpu_s": round(cpu, 3),
+            "cpu_ms_per_stream": round(cpu * 1000 / completed, 3),
+            "rss_idle_mb": round(rss_idle / 2**20, 1),
+            "rss_peak_mb": round(rss_peak / 2**20, 1),
+            "rss_kb_per_stream": round(max(rss_peak - rss_idle, 0) / 1024 / args.concurrency, 1),
+        },
+    }
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROXY_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers for the proxy")
+    parser.add_argument("--model", default="fake/chat")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cassette", help="replay this cassette from the fake upstream")
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--proxy-port", type=int, default=9180)
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="earlier result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="fail if a compared metric grows by more than this fraction")
+    parser.add_argument("--verbose", action="store_true", help="show proxy logs")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["comparison"], regressed = compare(result, json.load(f), args.max_regression)
+        result["regressed"] = regressed
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
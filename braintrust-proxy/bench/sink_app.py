@@ -0,0 +1,32 @@
+"""
+The proxy with Braintrust replaced by an in-process sink, for benchmarks.
+
+Traces still go through the log policy, the queue and the shipper thread,
+and each one is JSON-encoded the way the SDK would, but nothing leaves the
+process. Run with the proxy directory on the path:
+
+    gunicorn -c gunicorn.conf.py --pythonpath bench sink_app:app
+"""
+import json
+
+import app as proxy
+
+
+class SinkLogger:
+    """Stands in for `braintrust.init_logger()`: serializes and discards."""
+
+    def __init__(self, project=None):
+        self.project = project
+        self.events = 0
+        self.bytes = 0
+
+    def log(self, **event):
+        self.events += 1
+        self.bytes += len(json.dumps(event, default=str))
+
+    def flush(self):
+        pass
+
+
+proxy.shipper._logger_factory = SinkLogger
+app = proxy.app
@@ -0,0 +1,94 @@
+"""
+Benchmark: streamed chat completion forwarding, old path vs passthrough.
+
+Old path (before passthrough): the SDK parses every SSE chunk into a
+ChatCompletionChunk, the proxy re-encodes it with json.dumps(model_dump())
+and grows the transcript with `+=`. New path: SSETap splits the upstream
+bytes into events, forwards them unchanged and appends deltas to a list.
+
+Reports tokens forwarded per CPU-second (one core) for each path.
+
+Usage: python bench/sse_passthrough.py [--tokens 8000] [--runs 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+from openai import OpenAI, Stream
+from openai.types.chat import ChatCompletionChunk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from sse import SSETap  # noqa: E402
+
+
+def make_stream(tokens):
+    """One upstream SSE body with `tokens` single-token content chunks."""
+    events = []
+    for i in range(tokens):
+        chunk = {
+            "id": "gen-bench", "object": "chat.completion.chunk", "created": 1700000000,
+            "model": "anthropic/claude-sonnet-4.5", "provider": "Anthropic",
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": f" tok{i % 97}"},
+                         "finish_reason": None, "native_finish_reason": None, "logprobs": None}],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n".encode())
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+
+def old_path(events, client):
+    response = httpx.Response(200, content=b"".join(events), headers={"content-type": "text/event-stream"})
+    full_content = ""
+    out = 0
+    for chunk in Stream(cast_to=ChatCompletionChunk, response=response, client=client):
+        if chunk.choices and chunk.choices[0].delta.content:
+            full_content += chunk.choices[0].delta.content
+        out += len(f"data: {json.dumps(chunk.model_dump())}\n\n")
+    return out
+
+
+def new_path(events):
+    tap = SSETap()
+    out = 0
+    for data in events:
+        for event in tap.feed(data):
+            out += len(event)
+    tap.content
+    return out
+
+
+def measure(fn, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=8000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    events = make_stream(args.tokens)
+    client = OpenAI(api_key="bench", base_url="http://127.0.0.1:1/v1")
+    old_s = measure(lambda: old_path(events, client), args.runs)
+    new_s = measure(lambda: new_path(events), args.runs)
+    result = {
+        "tokens": args.tokens,
+        "old_cpu_s": round(old_s, 4),
+        "passthrough_cpu_s": round(new_s, 4),
+        "old_tokens_per_core_s": round(args.tokens / old_s),
+        "passthrough_tokens_per_core_s": round(args.tokens / new_s),
+        "speedup": round(old_s / new_s, 1),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-model circuit breakers.
+
+A model whose calls keep failing (5xx, timeouts, connection errors) or
+running slower than a threshold trips its breaker open: further requests
+for that model fail fast with an OpenAI-style 503 instead of each holding
+a connection for the full timeout. After `open_seconds` one probe request
+is let through (half-open); success closes the breaker, failure re-opens
+it. Other models are unaffected. Breakers exist only for models that have
+failed at least once.
+"""
+import sys
+import time
+from collections import deque
+
+from metrics import BREAKER_REJECTED, BREAKER_STATE, BREAKER_TRANSITIONS
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling upstream while a model's breaker is open."""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"Model {model} is temporarily unavailable (circuit open); retry after {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state over the last `window` calls of one model."""
+
+    def __init__(self, model, label, window=20, min_calls=5, error_ratio=0.5,
+                 slow_seconds=0.0, open_seconds=30.0):
+        self.model = model
+        self.label = label
+        self.window = deque(maxlen=window)  # True = failed or slow
+        self.min_calls = min_calls
+        self.error_ratio = error_ratio
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.rejected = 0
+
+    def allow(self):
+        """Admit a call or raise CircuitOpen. In half-open, admits one probe at a time."""
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, "cool-down elapsed")
+        if self.state == HALF_OPEN:
+            # A probe that never reported back (e.g. cancelled) expires.
+            if self.probe_started is None or now - self.probe_started >= self.open_seconds:
+                self.probe_started = now
+                return
+        if self.state == CLOSED:
+            return
+        self.rejected += 1
+        BREAKER_REJECTED.labels(self.label).inc()
+        retry_after = max(1, round(self.open_seconds - (now - self.opened_at)))
+        raise CircuitOpen(self.model, retry_after)
+
+    def record(self, failed, elapsed=0.0):
+        """Report a call's outcome; `failed=None` only releases a half-open probe."""
+        if failed is None:
+            self.probe_started = None
+            return
+        bad = failed or (self.slow_seconds > 0 and elapsed > self.slow_seconds)
+        if self.state == HALF_OPEN:
+            self.probe_started = None
+            if bad:
+                self._trip("probe failed")
+            else:
+                self.window.clear()
+                self._transition(CLOSED, "probe succeeded")
+            return
+        self.window.append(bad)
+        if self.state == CLOSED and len(self.window) >= self.min_calls:
+            failures = sum(self.window)
+            if failures / len(self.window) >= self.error_ratio:
+                self._trip(f"{failures}/{len(self.window)} recent calls failed or slow")
+
+    def _trip(self, reason):
+        self.opened_at = time.monotonic()
+        self._transition(OPEN, reason)
+
+    def _transition(self, state, reason):
+        print(f"[Breaker] {self.model}: {self.state} -> {state} ({reason})", file=sys.stderr)
+        self.state = state
+        BREAKER_TRANSITIONS.labels(self.label, state).inc()
+        BREAKER_STATE.labels(self.label).set(STATE_VALUES[state])
+
+    def stats(self):
+        return {"state": self.state, "recent_failures": sum(self.window),
+                "recent_calls": len(self.window), "rejected": self.rejected}
+
+
+class Breakers:
+    """Lazily created per-model breakers sharing one configuration."""
+
+    def __init__(self, label=lambda model: model, **config):
+        self._label = label
+        self._config = config
+        self._breakers = {}
+
+    def allow(self, model):
+        """Raise CircuitOpen if `model`'s breaker is rejecting calls."""
+        breaker = self._breakers.get(model)
+        if breaker is not None:
+            breaker.allow()
+
+    def record(self, model, failed, elapsed=0.0):
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            slow_seconds = self._config.get("slow_seconds", 0.0)
+            if not failed and not (slow_seconds > 0 and elapsed > slow_seconds):
+                return  # healthy models never need a breaker
+            breaker = self._breakers[model] = CircuitBreaker(model, self._label(model), **self._config)
+        breaker.record(failed, elapsed)
+
+    def stats(self):
+        return {model: breaker.stats() for model, breaker in self._breakers.items()
+                if breaker.state != CLOSED or any(breaker.window)}
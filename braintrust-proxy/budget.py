@@ -0,0 +1,205 @@
+"""
+Cost accounting and per-tenant spend budgets.
+
+Each call is priced from its usage: the `cost` upstream reports when it
+does (OpenRouter with usage accounting on), else token counts times the
+model catalog's per-token prices, with cached prompt tokens at the cache
+read price.
+
+Spend is summed per tenant and budget period (UTC month or day) in a
+SQLite file shared by every worker. Workers charge into memory and a
+background task folds the charges into the file every `sync_interval`
+seconds and reads back everyone's totals, so a budget check is a dict
+lookup and spend lags by at most one sync. Past the soft limit a chat
+request is sent to the downgrade model (or only flagged, if there is
+none); past the hard limit requests are rejected before going upstream.
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from metrics import BUDGET_ACTIONS
+from promptcache import cached_tokens
+
+PERIOD_FORMATS = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def request_cost(prices, usage, requests=1):
+    """USD for one upstream call: the reported cost, else usage x per-token prices."""
+    usage = usage or {}
+    reported = usage.get("cost")
+    if isinstance(reported, (int, float)):
+        return float(reported)
+    if not prices:
+        return 0.0
+    # Chat/embeddings usage, or the Responses API's input/output names.
+    prompt = usage.get("prompt_tokens") or usage.get("input_tokens") or 0
+    cached = min(cached_tokens(usage), prompt)
+    prompt_price = max(prices.get("prompt", 0.0), 0.0)
+    return ((prompt - cached) * prompt_price
+            + cached * max(prices.get("input_cache_read", prompt_price), 0.0)
+            + (usage.get("completion_tokens") or usage.get("output_tokens") or 0) * max(prices.get("completion", 0.0), 0.0)
+            + requests * max(prices.get("request", 0.0), 0.0))
+
+
+class BudgetExceeded(Exception):
+    """The tenant has spent its hard budget for the period."""
+
+    def __init__(self, tenant, spent, limit, period):
+        super().__init__(f"Spend budget exhausted for tenant {tenant}: ${spent:.2f} of ${limit:.2f} "
+                         f"this {period}")
+        self.tenant = tenant
+        self.spent = spent
+        self.limit = limit
+        self.period = period
+
+
+class SpendStore:
+    """(tenant, period) -> USD and request count, shared across workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spend ("
+                " tenant TEXT NOT NULL,"
+                " period TEXT NOT NULL,"
+                " usd REAL NOT NULL DEFAULT 0,"
+                " requests INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (tenant, period))"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, charges):
+        """Add {(period, tenant): [usd, requests]} to the totals."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO spend (tenant, period, usd, requests) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (tenant, period) DO UPDATE SET"
+                " usd = usd + excluded.usd, requests = requests + excluded.requests",
+                [(tenant, period, usd, requests) for (period, tenant), (usd, requests) in charges.items()],
+            )
+
+    def totals(self, period):
+        """{tenant: USD} for one period."""
+        return dict(self._conn().execute("SELECT tenant, usd FROM spend WHERE period = ?", (period,)))
+
+
+class Budgets:
+    """Per-tenant soft/hard USD limits over running spend."""
+
+    def __init__(self, store=None, soft=0.0, hard=0.0, downgrade=None, overrides=None, period="month",
+                 sync_interval=5.0, label=lambda tenant: tenant):
+        self.store = store
+        self.defaults = {"soft": soft, "hard": hard, "downgrade": downgrade}
+        self.overrides = overrides or {}
+        self.period = period
+        self.sync_interval = sync_interval
+        self._label = label
+        self._lock = threading.Lock()
+        self._pending = {}  # (period, tenant) -> [usd, requests] not yet in the store
+        self._totals = {}  # tenant -> USD this period, all workers, as of the last sync
+        self._totals_period = self._period_key()
+        self.actions = {"warned": 0, "downgraded": 0, "rejected": 0}
+        self.sync_errors = 0
+
+    def _period_key(self):
+        return time.strftime(PERIOD_FORMATS[self.period], time.gmtime())
+
+    def limits(self, tenant):
+        return {**self.defaults, **self.overrides.get(tenant, {})}
+
+    def spent(self, tenant):
+        """USD this period: the last synced total plus this worker's unsynced charges."""
+        period = self._period_key()
+        total = self._totals.get(tenant, 0.0) if self._totals_period == period else 0.0
+        with self._lock:
+            pending = self._pending.get((period, tenant))
+        return total + (pending[0] if pending else 0.0)
+
+    def check(self, tenant, model, downgrade=True):
+        """Model to send upstream and the budget action taken ("warned",
+        "downgraded" or None). Raises BudgetExceeded past the hard limit.
+        """
+        limits = self.limits(tenant)
+        if not (limits["soft"] or limits["hard"]):
+            return model, None
+        spent = self.spent(tenant)
+        if limits["hard"] and spent >= limits["hard"]:
+            self._count(tenant, "rejected")
+            raise BudgetExceeded(tenant, spent, limits["hard"], self.period)
+        if not limits["soft"] or spent < limits["soft"]:
+            return model, None
+        if downgrade and limits["downgrade"] and limits["downgrade"] != model:
+            self._count(tenant, "downgraded")
+            return limits["downgrade"], "downgraded"
+        self._count(tenant, "warned")
+        return model, "warned"
+
+    def _count(self, tenant, action):
+        self.actions[action] += 1
+        BUDGET_ACTIONS.labels(self._label(tenant), action).inc()
+
+    def charge(self, tenant, usd):
+        """Add one call's cost to the tenant's spend."""
+        key = (self._period_key(), tenant)
+        with self._lock:
+            entry = self._pending.setdefault(key, [0.0, 0])
+            entry[0] += usd
+            entry[1] += 1
+
+    def sync(self):
+        """Write this worker's charges to the store and reload every tenant's total."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        period = self._period_key()
+        if self.store is None:
+            totals = dict(self._totals) if self._totals_period == period else {}
+            for (charged_in, tenant), (usd, _) in pending.items():
+                if charged_in == period:
+                    totals[tenant] = totals.get(tenant, 0.0) + usd
+        else:
+            try:
+                if pending:
+                    self.store.add(pending)
+                totals = self.store.totals(period)
+            except Exception as e:
+                self.sync_errors += 1
+                print(f"[Budget] Spend sync failed, will retry: {e}", file=sys.stderr)
+                with self._lock:
+                    for key, (usd, requests) in pending.items():
+                        entry = self._pending.setdefault(key, [0.0, 0])
+                        entry[0] += usd
+                        entry[1] += requests
+                return
+        self._totals, self._totals_period = totals, period
+
+    async def run(self):
+        """Sync spend every `sync_interval` seconds until cancelled."""
+        while True:
+            await asyncio.to_thread(self.sync)
+            await asyncio.sleep(self.sync_interval)
+
+    def stats(self):
+        return {
+            "period": self._totals_period,
+            "tenants": len(self._totals),
+            "spent_usd": round(sum(self._totals.values()), 6),
+            "actions": dict(self.actions),
+            "sync_errors": self.sync_errors,
+        }
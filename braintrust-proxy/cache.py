@@ -0,0 +1,191 @@
+"""
+Exact-match response cache for deterministic chat completions.
+
+Keys are a SHA-256 over the canonical JSON of model, messages and sampling
+params, so two requests share an entry only when upstream would see the
+same body. Entries live in a per-worker in-memory LRU and, optionally, a
+SQLite file shared by every worker; both tiers honour a TTL and a byte cap.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+
+def canonical_key(model, messages, params):
+    """Stable hash of everything that determines the upstream response."""
+    body = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def cache_policy(headers):
+    """(read, write) for a request: `X-Proxy-Cache: bypass` or
+    `Cache-Control: no-cache` skip the lookup; `no-store` also skips the write."""
+    control = headers.get("Cache-Control", "").lower()
+    if "no-store" in control:
+        return False, False
+    if "no-cache" in control or headers.get("X-Proxy-Cache", "").lower() == "bypass":
+        return False, True
+    return True, True
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional SQLite) byte cache with TTL and size eviction."""
+
+    def __init__(self, ttl=3600, max_entries=1000, max_bytes=64 * 1024 * 1024,
+                 disk_path=None, disk_max_bytes=1024 * 1024 * 1024, purge_interval=60):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            conn = self._disk()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " key TEXT PRIMARY KEY,"
+                    " value BLOB NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " expires REAL NOT NULL,"
+                    " accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+                # Running total of `size`, so writes don't sum the table.
+                # Seeded from the rows of a cache file that predates it.
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+                conn.execute("INSERT OR IGNORE INTO meta (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM cache")
+
+    async def get(self, key):
+        """Cached bytes for `key`, or None. Disk hits are promoted to memory."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.time():
+                self._memory.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.labels("response", "hit").inc()
+                return value
+            self._drop(key)
+        if self.disk_path:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is not None:
+                self.disk_hits += 1
+                CACHE_LOOKUPS.labels("response", "disk_hit").inc()
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        CACHE_LOOKUPS.labels("response", "miss").inc()
+        return None
+
+    async def set(self, key, value):
+        """Store `value` (bytes) in both tiers."""
+        self._remember(key, value)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_set, key, value)
+
+    def stats(self):
+        return {
+            "entries": len(self._memory),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remember(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        self._drop(key)
+        self._memory[key] = (time.time() + self.ttl, value)
+        self._bytes += len(value)
+        while len(self._memory) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _disk(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key):
+        now = time.time()
+        conn = self._disk()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._delete(conn, "expires <= ? AND key = ?", (now, key))
+            return None
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _delete(self, conn, where, params):
+        """Delete matching rows and take their size off the running total; returns bytes freed."""
+        freed = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM cache WHERE {where}", params).fetchone()[0]
+        if freed:
+            conn.execute(f"DELETE FROM cache WHERE {where}", params)
+            conn.execute("UPDATE meta SET bytes = bytes - ? WHERE id = 0", (freed,))
+        return freed
+
+    def _disk_set(self, key, value):
+        now = time.time()
+        conn = self._disk()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete(conn, "key = ?", (key,))
+            conn.execute(
+                "INSERT INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + self.ttl, now),
+            )
+            conn.execute("UPDATE meta SET bytes = bytes + ? WHERE id = 0", (len(value),))
+            total = conn.execute("SELECT bytes FROM meta WHERE id = 0").fetchone()[0]
+            # Expired rows go on a schedule, or first when over budget.
+            if total > self.disk_max_bytes or now - self._purged_at >= self.purge_interval:
+                self._purged_at = now
+                total -= self._delete(conn, "expires <= ?", (now,))
+            if total > self.disk_max_bytes:
+                freed = 0
+                doomed = []
+                for old_key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+                    doomed.append((old_key,))
+                    freed += size
+                    if total - freed <= self.disk_max_bytes:
+                        break
+                conn.executemany("DELETE FROM cache WHERE key = ?", doomed)
+                conn.execute("UPDATE meta SET bytes = bytes - ? WHERE id = 0", (freed,))
+                self.evictions += len(doomed)
@@ -0,0 +1,124 @@
+"""
+Cached, conditionally refreshed /v1/models catalog.
+
+The upstream catalog (several hundred models) is fetched once per TTL and
+kept as a pre-serialized JSON body, its gzip encoding and an ETag, so
+/v1/models is a byte copy (or a 304) instead of a fetch and re-dump per
+request. Stale entries are served while a single background refresh runs.
+The parsed entries double as the proxy's source of context-length and
+pricing metadata; lookups revalidate too, so a failed startup fetch or a
+catalog nobody lists is retried (at most every `retry_after` seconds).
+"""
+import asyncio
+import gzip
+import hashlib
+import sys
+import time
+
+import codec
+
+
+class ModelCatalog:
+    """Stale-while-revalidate holder for the upstream model list."""
+
+    def __init__(self, fetch, ttl=300, retry_after=30):
+        self._fetch = fetch  # async () -> list of model dicts
+        self._refreshing = None
+        self._attempted_at = 0.0
+        self._by_id = {}
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.body = None
+        self.gzip_body = None
+        self.etag = None
+        self.fetched_at = 0.0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @property
+    def stale(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    async def get(self):
+        """Return self with a body loaded; stale bodies are served while refreshing."""
+        if self.body is None:
+            await self.refresh()
+        elif self.stale:
+            self.refresh_in_background()
+        return self
+
+    def refresh_in_background(self):
+        if self._refreshing is None or self._refreshing.done():
+            self._attempted_at = time.time()
+            self._refreshing = asyncio.ensure_future(self._refresh())
+            self._refreshing.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refreshing
+
+    async def refresh(self):
+        """Fetch now (joining a refresh already in progress)."""
+        await asyncio.shield(self.refresh_in_background())
+
+    async def run(self, interval):
+        """Refresh every `interval` seconds so requests never see a stale catalog."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # already logged; keep serving the last good catalog
+            await asyncio.sleep(interval)
+
+    async def _refresh(self):
+        try:
+            models = await self._fetch()
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"[Catalog] Refresh failed: {e}", file=sys.stderr)
+            raise
+        body = codec.dumps({"object": "list", "data": models})
+        self._by_id = {entry.get("id"): entry for entry in models}
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.fetched_at = time.time()
+        self.refreshes += 1
+
+    def revalidate(self):
+        """Start a background refresh if unloaded or stale, unless one was tried in the last `retry_after` s."""
+        if self.body is not None and not self.stale:
+            return
+        if time.time() - self._attempted_at < self.retry_after:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.refresh_in_background()
+
+    def info(self, model):
+        """Catalog entry for `model` (None until loaded or if unknown). Never blocks."""
+        self.revalidate()
+        return self._by_id.get(model)
+
+    def context_length(self, model):
+        entry = self.info(model) or {}
+        return entry.get("context_length") or (entry.get("top_provider") or {}).get("context_length")
+
+    def pricing(self, model):
+        """Per-token USD prices as floats, e.g. {"prompt": 3e-06, "completion": 1.5e-05}."""
+        prices = {}
+        for key, value in ((self.info(model) or {}).get("pricing") or {}).items():
+            try:
+                prices[key] = float(value)
+            except (TypeError, ValueError):
+                continue
+        return prices
+
+    def stats(self):
+        return {
+            "models": len(self._by_id),
+            "age_s": round(time.time() - self.fetched_at, 1) if self.body else None,
+            "bytes": len(self.body) if self.body else 0,
+            "gzip_bytes": len(self.gzip_body) if self.gzip_body else 0,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
@@ -0,0 +1,61 @@
+"""
+JSON codec for the hot paths.
+
+Request bodies, SSE chunks, cached completions, embeddings and spooled
+traces are encoded and decoded here: with orjson when it is installed (or
+whichever backend `select()` picks), else the stdlib `json` module.
+Either way `dumps` returns compact UTF-8 bytes, ready to write.
+
+SDK response models go straight to bytes through pydantic's own
+serializer (`dump_model`), without building a dict tree first.
+
+Cache keys and conversation hashes keep using the stdlib encoder: they are
+persisted, and must not change when the backend does.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib backend is used instead
+    orjson = None
+
+
+def _json_dumps(value, default=None):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=default).encode()
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def _orjson_dumps(value, default=None):
+    return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+BACKENDS = {"json": (_json_dumps, _json_loads)}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_dumps, orjson.loads)
+
+name = None
+dumps = loads = None
+
+
+def select(backend=None):
+    """Use `backend` ("orjson" or "json"); the fastest installed one if None or unavailable."""
+    global name, dumps, loads
+    if backend not in BACKENDS:
+        backend = "orjson" if "orjson" in BACKENDS else "json"
+    name = backend
+    dumps, loads = BACKENDS[backend]
+    return name
+
+
+def dump_model(model):
+    """An SDK response model as JSON bytes, serialized without an intermediate dict."""
+    serializer = getattr(model, "__pydantic_serializer__", None)
+    if serializer is None:  # pydantic v1
+        return dumps(model.dict())
+    return serializer.to_json(model, warnings=False)
+
+
+select()
@@ -0,0 +1,171 @@
+"""
+Pre-flight context-window checks.
+
+Prompt tokens are counted locally before a request goes upstream: with
+tiktoken when it is installed (and its encoding can be loaded), otherwise
+from character counts. Either count is then scaled by a per-model ratio
+learned from the `prompt_tokens` upstream reports, so the estimate tracks
+each model's real tokenizer after a few calls.
+
+The estimate is checked against the catalog's context length (and the
+provider's max completion tokens). A prompt that can't fit is rejected with
+OpenAI's `context_length_exceeded` error instead of a full upstream round
+trip; a `max_tokens` that would overflow the window is clamped (policy
+"clamp") or rejected (policy "reject").
+"""
+import sys
+
+from metrics import CONTEXT_ENFORCED
+
+MESSAGE_OVERHEAD = 4  # role + separators per message, as in OpenAI's cookbook
+REPLY_OVERHEAD = 3
+IMAGE_TOKENS = 85  # low-detail image; enough to keep estimates honest
+
+
+def load_encoding(name):
+    """tiktoken encoding, or None if tiktoken (or its BPE file) isn't available."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"[Context] tiktoken encoding {name} unavailable ({e}); using character estimate", file=sys.stderr)
+        return None
+
+
+class ContextLimitExceeded(Exception):
+    """The request can't fit the model's context window."""
+
+    def __init__(self, model, prompt_tokens, max_tokens, limit, param="messages"):
+        requested = f" ({prompt_tokens} in the messages, {max_tokens} in the completion)" if max_tokens else ""
+        super().__init__(
+            f"This model's maximum context length is {limit} tokens. However, you requested about "
+            f"{prompt_tokens + (max_tokens or 0)} tokens{requested}. Please reduce the length of the "
+            f"messages or completion.")
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.limit = limit
+        self.param = param
+
+
+class TokenEstimator:
+    """Prompt token counts, calibrated per model against upstream usage."""
+
+    def __init__(self, encoding=None, chars_per_token=4.0, alpha=0.1, max_models=500):
+        self.encoding = encoding
+        self.chars_per_token = chars_per_token
+        self.alpha = alpha
+        self.max_models = max_models
+        self._ratios = {}  # model -> EWMA of actual / base count
+        self._global = 1.0
+        self.samples = 0
+
+    def base_count(self, messages, tools=None):
+        """Uncalibrated prompt tokens for a messages list (plus tool definitions)."""
+        texts, images = [], 0
+        for message in messages:
+            if not isinstance(message, dict):
+                continue  # malformed; upstream rejects it
+            content = message.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+            elif isinstance(content, list):
+                for part in content:
+                    if not isinstance(part, dict):
+                        continue
+                    if part.get("type") == "text":
+                        texts.append(part.get("text") or "")
+                    elif part.get("type") in ("image_url", "input_image"):
+                        images += 1
+            for key in ("name", "tool_calls", "function_call"):
+                if message.get(key):
+                    texts.append(str(message[key]))
+        if tools:
+            texts.append(str(tools))
+        if self.encoding is not None:
+            text_tokens = sum(len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts))
+        else:
+            text_tokens = int(sum(len(text) for text in texts) / self.chars_per_token)
+        return text_tokens + MESSAGE_OVERHEAD * len(messages) + REPLY_OVERHEAD + IMAGE_TOKENS * images
+
+    def ratio(self, model):
+        return self._ratios.get(model, self._global)
+
+    def count(self, model, base):
+        return int(base * self.ratio(model)) + 1
+
+    def observe(self, model, base, actual):
+        """Fold in the prompt_tokens upstream reported for a request counted as `base`."""
+        if not base or not actual:
+            return
+        sample = min(max(actual / base, 0.25), 4.0)
+        self.samples += 1
+        self._global += self.alpha * (sample - self._global)
+        if model in self._ratios or len(self._ratios) < self.max_models:
+            current = self._ratios.get(model, self._global)
+            self._ratios[model] = current + self.alpha * (sample - current)
+
+    def stats(self):
+        return {
+            "tokenizer": self.encoding.name if self.encoding is not None else "chars",
+            "samples": self.samples,
+            "ratio": round(self._global, 3),
+            "models": len(self._ratios),
+        }
+
+
+class ContextGuard:
+    """Reject or clamp requests that would overflow a model's context window."""
+
+    def __init__(self, catalog, estimator, policy="clamp", margin=0.05, label=lambda model: model):
+        self.catalog = catalog
+        self.estimator = estimator
+        self.policy = policy  # "clamp", "reject" or "off"
+        self.margin = margin
+        self._label = label
+        self.rejected = 0
+        self.clamped = 0
+
+    def check(self, model, messages, params):
+        """Estimate prompt tokens and enforce the window; may lower params["max_tokens"].
+
+        Returns (estimated prompt tokens, base count for calibration, original
+        max_tokens if clamped else None). Raises ContextLimitExceeded.
+        """
+        base = self.estimator.base_count(messages, params.get("tools"))
+        prompt_tokens = self.estimator.count(model, base)
+        limit = self.catalog.context_length(model) if self.policy != "off" else None
+        if not limit:
+            return prompt_tokens, base, None
+
+        # The estimate can be off either way: only reject prompts clearly over the window.
+        if prompt_tokens * (1 - self.margin) > limit:
+            self._reject(model, prompt_tokens, None, limit)
+        key = "max_completion_tokens" if "max_completion_tokens" in params else "max_tokens"
+        requested = params.get(key)
+        if not isinstance(requested, int):
+            return prompt_tokens, base, None
+        # ...but leave headroom for it when sizing the completion.
+        available = limit - int(prompt_tokens * (1 + self.margin))
+        provider_max = ((self.catalog.info(model) or {}).get("top_provider") or {}).get("max_completion_tokens")
+        if provider_max:
+            available = min(available, provider_max)
+        if requested <= available:
+            return prompt_tokens, base, None
+        if self.policy == "reject" or available < 1:
+            self._reject(model, prompt_tokens, requested, limit, key)
+        params[key] = available
+        self.clamped += 1
+        CONTEXT_ENFORCED.labels(self._label(model), "clamped").inc()
+        return prompt_tokens, base, requested
+
+    def _reject(self, model, prompt_tokens, max_tokens, limit, param="messages"):
+        self.rejected += 1
+        CONTEXT_ENFORCED.labels(self._label(model), "rejected").inc()
+        raise ContextLimitExceeded(model, prompt_tokens, max_tokens, limit, param)
+
+    def stats(self):
+        return {"policy": self.policy, "rejected": self.rejected, "clamped": self.clamped,
+                "estimator": self.estimator.stats()}
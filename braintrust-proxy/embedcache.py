@@ -0,0 +1,101 @@
+"""
+Content-addressed embedding cache.
+
+Each input text is cached on its own under sha256(model, text) as a packed
+float32 vector, so a request only sends upstream the texts that were never
+embedded before. Vectors live in a SQLite file opened with `mmap_size`, so
+lookups read straight from the memory-mapped database pages; the file is
+shared by every worker and survives restarts when placed on a volume.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+from metrics import CACHE_LOOKUPS
+
+
+def text_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode()).digest()
+
+
+class EmbeddingCache:
+    """(model, sha256(text)) -> float32 bytes, oldest-first eviction past max_bytes."""
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, mmap_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_bytes = mmap_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " key BLOB PRIMARY KEY,"
+            " vec BLOB NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (id, bytes) VALUES (0, 0)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model, texts):
+        """float32 bytes per text, None where the text has not been embedded yet."""
+        keys = [text_key(model, text) for text in texts]
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(conn.execute(f"SELECT key, vec FROM vectors WHERE key IN ({marks})", chunk))
+        vectors = [found.get(key) for key in keys]
+        hits = sum(1 for vec in vectors if vec is not None)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        CACHE_LOOKUPS.labels("embedding", "hit").inc(hits)
+        CACHE_LOOKUPS.labels("embedding", "miss").inc(len(vectors) - hits)
+        return vectors
+
+    def put_many(self, model, items):
+        """Store (text, float32 bytes) pairs; evicts the oldest vectors past max_bytes."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            added = 0
+            for text, vec in items:
+                cur = conn.execute("INSERT OR IGNORE INTO vectors (key, vec) VALUES (?, ?)", (text_key(model, text), vec))
+                if cur.rowcount:
+                    added += len(vec)
+            conn.execute("UPDATE meta SET bytes = bytes + ? WHERE id = 0", (added,))
+            total = conn.execute("SELECT bytes FROM meta WHERE id = 0").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn, excess):
+        # Free an extra 10% so a full cache doesn't evict on every insert.
+        target = excess + self.max_bytes // 10
+        cutoff, freed, count = None, 0, 0
+        for rowid, size in conn.execute("SELECT rowid, length(vec) FROM vectors ORDER BY rowid"):
+            cutoff, freed, count = rowid, freed + size, count + 1
+            if freed >= target:
+                break
+        if cutoff is not None:
+            conn.execute("DELETE FROM vectors WHERE rowid <= ?", (cutoff,))
+            conn.execute("UPDATE meta SET bytes = bytes - ? WHERE id = 0", (freed,))
+            self.evicted += count
+
+    def stats(self):
+        total = self._conn().execute("SELECT bytes FROM meta WHERE id = 0").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "bytes": total,
+                "max_bytes": self.max_bytes, "evicted": self.evicted}
@@ -0,0 +1,33 @@
+"""
+Gunicorn settings for the Braintrust proxy.
+Uvicorn workers run the Quart (ASGI) app, so streams don't pin a worker.
+"""
+import os
+import shutil
+
+# Workers write Prometheus samples here so /metrics can sum across them.
+# Must be set before prometheus_client is first imported (it picks its
+# value storage at import time, and workers inherit the master's modules).
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/braintrust-proxy/metrics")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Let in-flight streams finish on rollout before the worker is killed.
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+
+
+def on_starting(server):
+    """Start from an empty metrics dir; stale files would double-count."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges (in-flight streams, queue depth, breaker state)."""
+    multiprocess.mark_process_dead(worker.pid)
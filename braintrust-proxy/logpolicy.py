@@ -0,0 +1,169 @@
+"""
+What gets logged to Braintrust, and how much of it.
+
+- Sampling: a keep rate per route / model pattern (`LOG_SAMPLE_RULES`,
+  first match wins, else `LOG_SAMPLE_RATE`). Errors, aborted streams and
+  calls slower than `keep_slow_ms` are always kept. Kept traces record
+  their `sample_rate` so counts can be re-weighted.
+- Conversation deltas: chat clients resend the whole history every turn.
+  Each message list gets a chain of prefix hashes; when a prefix of it was
+  already logged by this worker, only the messages after it are logged,
+  with `prefix_hash` pointing at the earlier trace's `conversation_hash`.
+- Truncation: strings in input/output are clipped (longest first) so a
+  trace stays under `max_bytes` of JSON.
+"""
+import fnmatch
+import hashlib
+import json
+import random
+from collections import OrderedDict
+
+import codec
+from metrics import LOG_EVENTS
+
+
+def parse_rules(raw):
+    """[(route pattern, model pattern, rate)] from `LOG_SAMPLE_RULES` JSON."""
+    if not raw:
+        return []
+    return [(rule.get("route", "*"), rule.get("model", "*"), float(rule["rate"])) for rule in json.loads(raw)]
+
+
+def prefix_hashes(tenant, messages):
+    """Hash of every prefix of `messages`: hashes[i] covers messages[:i + 1]."""
+    digest = hashlib.sha256(str(tenant).encode()).hexdigest()[:16]
+    hashes = []
+    for message in messages:
+        body = json.dumps(message, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        digest = hashlib.sha256((digest + body).encode()).hexdigest()[:16]
+        hashes.append(digest)
+    return hashes
+
+
+def _lengths(value, out):
+    if isinstance(value, str):
+        out.append(len(value))
+    elif isinstance(value, dict):
+        for item in value.values():
+            _lengths(item, out)
+    elif isinstance(value, list):
+        for item in value:
+            _lengths(item, out)
+    return out
+
+
+def _clip(value, cap):
+    if isinstance(value, str):
+        if len(value) <= cap:
+            return value
+        return value[:cap] + f"…[truncated {len(value) - cap} chars]"
+    if isinstance(value, dict):
+        return {key: _clip(item, cap) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clip(item, cap) for item in value]
+    return value
+
+
+def truncate(value, max_bytes):
+    """(value with its longest strings clipped to fit ~max_bytes of JSON, truncated?)."""
+    size = len(codec.dumps(value, default=str))
+    if size <= max_bytes:
+        return value, False
+    lengths = sorted(_lengths(value, []))
+    if not lengths:
+        return value, False
+    # Fill short strings whole, then give every longer string the same cap.
+    budget = max_bytes - (size - sum(lengths))
+    cap = 0
+    for i, length in enumerate(lengths):
+        share = budget // (len(lengths) - i)
+        if length > share:
+            cap = max(share, 0)
+            break
+        budget -= length
+    return _clip(value, cap), True
+
+
+class LogPolicy:
+    """Sampling, conversation deltas and truncation applied before a trace is queued."""
+
+    def __init__(self, rules=(), default_rate=1.0, keep_slow_ms=0.0, max_bytes=0, delta=False,
+                 max_prefixes=10000):
+        self.rules = list(rules)
+        self.default_rate = default_rate
+        self.keep_slow_ms = keep_slow_ms
+        self.max_bytes = max_bytes
+        self.delta = delta
+        self.max_prefixes = max_prefixes
+        self._prefixes = OrderedDict()  # conversation hashes this worker has logged
+        self.kept = 0
+        self.sampled_out = 0
+        self.truncated = 0
+        self.delta_traces = 0
+        self.delta_messages_skipped = 0
+
+    def rate(self, route, model):
+        for route_pattern, model_pattern, rate in self.rules:
+            if fnmatch.fnmatchcase(route, route_pattern) and fnmatch.fnmatchcase(model, model_pattern):
+                return rate
+        return self.default_rate
+
+    def apply(self, route, event, keep=False):
+        """The event to queue (possibly reduced), or None if sampled out.
+
+        `keep` forces it through sampling (errors, aborted streams).
+        """
+        metadata = event.setdefault("metadata", {})
+        duration_ms = (event.get("metrics") or {}).get("duration_ms", 0.0)
+        keep = keep or bool(event.get("error")) or (0 < self.keep_slow_ms <= duration_ms)
+        rate = self.rate(route, metadata.get("model") or "")
+        if not keep and rate < 1.0:
+            if random.random() >= rate:
+                self.sampled_out += 1
+                LOG_EVENTS.labels("sampled_out").inc()
+                return None
+            metadata["sample_rate"] = rate
+        self.kept += 1
+
+        messages = event.get("input")
+        if self.delta and isinstance(messages, list) and messages and isinstance(messages[0], dict):
+            event["input"] = self._delta(metadata, messages)
+
+        if self.max_bytes:
+            (event["input"], event["output"]), clipped = truncate(
+                [event.get("input"), event.get("output")], self.max_bytes)
+            if clipped:
+                self.truncated += 1
+                metadata["truncated"] = True
+        return event
+
+    def _delta(self, metadata, messages):
+        """Messages after the longest prefix already logged; records the hash chain in metadata."""
+        hashes = prefix_hashes(metadata.get("tenant"), messages)
+        metadata["conversation_hash"] = hashes[-1]
+        skip = 0
+        for i in range(len(hashes) - 1, -1, -1):
+            if hashes[i] in self._prefixes:
+                self._prefixes.move_to_end(hashes[i])
+                skip = i + 1
+                break
+        self._prefixes[hashes[-1]] = None
+        if len(self._prefixes) > self.max_prefixes:
+            self._prefixes.popitem(last=False)
+        if not skip:
+            return messages
+        metadata["prefix_hash"] = hashes[skip - 1]
+        metadata["prefix_messages"] = skip
+        self.delta_traces += 1
+        self.delta_messages_skipped += skip
+        return messages[skip:]
+
+    def stats(self):
+        return {
+            "kept": self.kept,
+            "sampled_out": self.sampled_out,
+            "truncated": self.truncated,
+            "delta_traces": self.delta_traces,
+            "delta_messages_skipped": self.delta_messages_skipped,
+            "prefixes": len(self._prefixes),
+        }
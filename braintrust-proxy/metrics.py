@@ -0,0 +1,130 @@
+"""
+Prometheus metrics for the proxy.
+
+Each gunicorn worker is its own process, so metrics use prometheus_client's
+multiprocess mode: gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a
+shared directory, every worker writes its samples to mmap'd files there, and
+/metrics on whichever worker answers aggregates all of them. Without that
+variable (e.g. `python app.py`) the default in-process registry is used.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+class BoundedLabel:
+    """Pass label values through until `limit` distinct ones were seen, then "other".
+
+    Values that aren't strings (a client's `"model": ["a"]`) report as "invalid".
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.seen = set()
+
+    def __call__(self, value):
+        if not isinstance(value, str):
+            return "invalid"
+        if value in self.seen or len(self.seen) < self.limit:
+            self.seen.add(value)
+            return value
+        return "other"
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+INTER_TOKEN_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+
+REQUESTS = Counter(
+    "proxy_requests_total", "Requests handled by the proxy.", ["route", "model", "status"])
+UPSTREAM_LATENCY = Histogram(
+    "proxy_upstream_latency_seconds", "Upstream call latency (to first byte for streams).",
+    ["route", "model"], buckets=LATENCY_BUCKETS)
+TTFT = Histogram(
+    "proxy_stream_ttft_seconds", "Time from request to the first streamed token.",
+    ["model"], buckets=TTFT_BUCKETS)
+INTER_TOKEN = Histogram(
+    "proxy_stream_inter_token_seconds", "Gap between consecutive streamed token chunks.",
+    ["model"], buckets=INTER_TOKEN_BUCKETS)
+TOKENS_PER_SECOND = Histogram(
+    "proxy_completion_tokens_per_second", "Completion tokens per second of generation.",
+    ["model", "stream"], buckets=TOKENS_PER_SECOND_BUCKETS)
+TOKENS = Counter(
+    "proxy_tokens_total", "Prompt, completion and cached prompt tokens reported by upstream.", ["model", "kind"])
+UPSTREAM_HTTP_REQUESTS = Counter(
+    "proxy_upstream_http_requests_total", "Upstream HTTP requests by negotiated protocol.", ["http_version"])
+UPSTREAM_CONNECTIONS = Counter(
+    "proxy_upstream_connections_opened_total", "New upstream TCP connections (requests minus these were reused).")
+UPSTREAM_TLS_HANDSHAKE = Histogram(
+    "proxy_upstream_tls_handshake_seconds", "Upstream TLS handshake time.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+UPSTREAM_CALLS = Counter(
+    "proxy_upstream_calls_total", "Calls per routed upstream by outcome.", ["upstream", "outcome"])
+UPSTREAM_FAILOVERS = Counter(
+    "proxy_upstream_failovers_total", "Calls moved to the next upstream after a retryable failure.", ["upstream"])
+UPSTREAM_HEDGES = Counter(
+    "proxy_upstream_hedges_total", "Hedged calls by which attempt answered first.", ["winner"])
+BREAKER_STATE = Gauge(
+    "proxy_circuit_breaker_state", "Per-model breaker state (0 closed, 1 half-open, 2 open); max across live workers.",
+    ["model"], multiprocess_mode="livemax")
+BREAKER_TRANSITIONS = Counter(
+    "proxy_circuit_breaker_transitions_total", "Breaker state changes by the state entered.", ["model", "state"])
+BREAKER_REJECTED = Counter(
+    "proxy_circuit_breaker_rejected_total", "Requests failed fast by an open breaker.", ["model"])
+ADMISSION_QUEUE_WAIT = Histogram(
+    "proxy_admission_queue_wait_seconds", "Time a request waited in the proxy before going upstream.",
+    ["tenant"], buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+ADMISSION_REJECTED = Counter(
+    "proxy_admission_rejected_total", "Requests rejected with 429 by admission control.", ["tenant", "reason"])
+ADMISSION_WAITING = Gauge(
+    "proxy_admission_waiting", "Requests queued for admission.", multiprocess_mode="livesum")
+STREAMS_IN_FLIGHT = Gauge(
+    "proxy_streams_in_flight", "Chat streams currently open.", ["model"], multiprocess_mode="livesum")
+PROMPT_CACHE_HINTS = Counter(
+    "proxy_prompt_cache_hints_total", "Requests sent upstream with cache_control breakpoints added.", ["model"])
+CONTEXT_ENFORCED = Counter(
+    "proxy_context_enforced_total", "Requests rejected or max_tokens clamped by the context-window check.",
+    ["model", "action"])
+ABORTED_STREAMS = Counter(
+    "proxy_streams_aborted_total", "Chat streams cut short by a client disconnect.", ["model"])
+COST = Counter(
+    "proxy_cost_usd_total", "Upstream spend in USD (reported by upstream, else from catalog pricing).",
+    ["model", "tenant"])
+BUDGET_ACTIONS = Counter(
+    "proxy_budget_actions_total", "Requests warned, downgraded or rejected by tenant spend budgets.",
+    ["tenant", "action"])
+LOG_QUEUE_DEPTH = Gauge(
+    "proxy_log_queue_depth", "Traces waiting in the Braintrust shipper queue.", multiprocess_mode="livesum")
+LOG_EVENTS = Counter(
+    "proxy_log_events_total", "Braintrust traces by outcome.", ["outcome"])
+LOG_SPOOL_EVENTS = Gauge(
+    "proxy_log_spool_events", "Traces waiting in the on-disk spool.", multiprocess_mode="livemax")
+CACHE_LOOKUPS = Counter(
+    "proxy_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+SINGLE_FLIGHT_SAVED = Counter(
+    "proxy_single_flight_saved_total", "Upstream calls avoided by coalescing identical requests.")
+EMBEDDING_BATCH_FILL = Histogram(
+    "proxy_embedding_batch_fill_ratio", "Items per merged embedding call / max items.",
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0))
+
+
+def render():
+    """Exposition text for /metrics, aggregated across workers when multiprocess."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,79 @@
+"""
+Generic pass-through for `/v1/*` routes the proxy has no handler for.
+
+Request and response bodies are streamed between client and upstream as
+raw bytes, never parsed into SDK objects, so new upstream endpoints and
+parameters work without a proxy change. A `BodyTap` on each side keeps
+the first `limit` bytes for the trace; only a body that fits is decoded,
+once, after it has been forwarded. Event streams go through `SSETap`, as
+for chat, so streamed usage is still collected.
+"""
+import zlib
+
+import codec
+
+# RFC 9110 connection-specific headers, plus the ones httpx sets itself.
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+              "transfer-encoding", "upgrade", "host", "content-length"}
+
+
+def request_headers(headers, api_key):
+    """Client headers to send upstream, with the proxy's upstream key."""
+    forwarded = {key: value for key, value in headers.items()
+                 if key.lower() not in HOP_BY_HOP and key.lower() != "authorization"}
+    if headers.get("Content-Length"):
+        forwarded["Content-Length"] = headers["Content-Length"]
+    if api_key:
+        forwarded["Authorization"] = f"Bearer {api_key}"
+    return forwarded
+
+
+def response_headers(headers):
+    """Upstream response headers to return to the client (the server sets its own date and server)."""
+    return [(key, value) for key, value in headers.multi_items()
+            if key.lower() not in HOP_BY_HOP and key.lower() not in ("date", "server")]
+
+
+class BodyTap:
+    """Counts the bytes of a streamed body and keeps the first `limit` of them."""
+
+    def __init__(self, content_type="", limit=65536, encoding=None):
+        self.content_type = content_type or ""
+        self.encoding = (encoding or "identity").lower()
+        self.limit = limit
+        self.size = 0
+        self._parts = []
+        self._kept = 0
+
+    def feed(self, data):
+        self.size += len(data)
+        if self._kept < self.limit:
+            part = data[:self.limit - self._kept]
+            self._parts.append(part)
+            self._kept += len(part)
+        return data
+
+    @property
+    def complete(self):
+        return self.size <= self.limit
+
+    def json(self):
+        """The body decoded as JSON, or None if it's not JSON or was cut off."""
+        if not self.complete or "json" not in self.content_type:
+            return None
+        body = b"".join(self._parts)
+        try:
+            if self.encoding in ("gzip", "deflate"):
+                body = zlib.decompress(body, zlib.MAX_WBITS | 32)  # gzip or zlib header
+            elif self.encoding != "identity":
+                return None
+            return codec.loads(body)
+        except (ValueError, zlib.error):
+            return None
+
+    def summary(self):
+        """What the trace shows for the body: decoded JSON, else its size."""
+        decoded = self.json()
+        if decoded is not None:
+            return decoded
+        return f"[{self.size} bytes {self.content_type.split(';')[0] or 'body'}]" if self.size else None
@@ -0,0 +1,159 @@
+"""
+Automatic prompt-cache breakpoints.
+
+Chat clients like AnythingLLM resend the same large system prompt (and the
+conversation so far) every turn. OpenAI-style providers cache repeated
+prefixes on their own; Anthropic and Gemini models behind OpenRouter only
+cache up to content parts marked `cache_control: {"type": "ephemeral"}`.
+
+Every request's message prefixes are hashed (chained, seeded with the
+tenant, as in the log policy). A prefix seen `min_repeats` times within
+`ttl` seconds and long enough to be worth caching is stable: for models
+matching `models`, the upstream copy of the messages gets a breakpoint at
+the end of the longest stable prefix, and one at the end of the system
+prompt when that is stable on its own. The caller's messages (and so the
+trace and cache keys) are left untouched.
+"""
+import copy
+import fnmatch
+import time
+from collections import OrderedDict
+
+from logpolicy import prefix_hashes
+from metrics import PROMPT_CACHE_HINTS
+
+MARKER = {"type": "ephemeral"}
+
+
+def _chars(message):
+    content = message.get("content")
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(len(part.get("text") or "") for part in content if isinstance(part, dict))
+    return 0
+
+
+def _has_marker(messages):
+    return any(isinstance(message.get("content"), list)
+               and any(isinstance(part, dict) and "cache_control" in part for part in message["content"])
+               for message in messages)
+
+
+def _markable(message):
+    """Whether `message` has text to hang a breakpoint on (tool-call turns may have none)."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return bool(content)
+    if isinstance(content, list):
+        return any(isinstance(part, dict) and part.get("type") == "text" for part in content)
+    return False
+
+
+def _last_markable(messages, end):
+    """Index of the last message at or before `end` with text, or -1."""
+    while end >= 0 and not _markable(messages[end]):
+        end -= 1
+    return end
+
+
+def _mark(message):
+    """Copy of `message` with a cache breakpoint on its last text part."""
+    message = copy.copy(message)
+    content = message.get("content")
+    if isinstance(content, str):
+        message["content"] = [{"type": "text", "text": content, "cache_control": MARKER}]
+        return message
+    if not isinstance(content, list):
+        return message
+    parts = copy.deepcopy(content)
+    for part in reversed(parts):
+        if isinstance(part, dict) and part.get("type") == "text":
+            part["cache_control"] = MARKER
+            break
+    message["content"] = parts
+    return message
+
+
+class PromptCacheHints:
+    """Tracks per-tenant prefix repeats and marks stable prefixes for caching."""
+
+    def __init__(self, models=("anthropic/*", "google/gemini-*"), min_tokens=1024, min_repeats=2,
+                 ttl=300.0, max_prefixes=50000, chars_per_token=4.0, max_breakpoints=2, label=lambda model: model):
+        self.models = list(models)
+        self.min_chars = min_tokens * chars_per_token
+        self.min_repeats = min_repeats
+        self.ttl = ttl
+        self.max_prefixes = max_prefixes
+        self.max_breakpoints = max_breakpoints
+        self._label = label
+        self._seen = OrderedDict()  # prefix hash -> (repeats, last seen)
+        self.hinted = 0
+        self.requests = 0
+        self.prompt_tokens = {}  # model -> prompt tokens upstream reported
+        self.cached_tokens = {}  # model -> of which served from the provider's cache
+
+    def wants_markers(self, model):
+        return any(fnmatch.fnmatchcase(model, pattern) for pattern in self.models)
+
+    def apply(self, tenant, model, messages):
+        """(messages to send upstream, breakpoint indexes). Never mutates `messages`."""
+        self.requests += 1
+        if not messages or not isinstance(messages[0], dict):
+            return messages, []
+        now = time.monotonic()
+        stable = []
+        chars = 0
+        for i, digest in enumerate(prefix_hashes(tenant, messages)):
+            chars += _chars(messages[i])
+            repeats, seen_at = self._seen.get(digest, (0, 0.0))
+            repeats = repeats + 1 if now - seen_at <= self.ttl else 1
+            self._seen[digest] = (repeats, now)
+            self._seen.move_to_end(digest)
+            if repeats >= self.min_repeats and chars >= self.min_chars:
+                stable.append(i)
+        while len(self._seen) > self.max_prefixes:
+            self._seen.popitem(last=False)
+
+        if not stable or not self.wants_markers(model) or _has_marker(messages):
+            return messages, []
+        # The longest stable prefix, plus the system prompt on its own so new
+        # conversations in the same workspace still hit the cache. A prefix
+        # ending in turns without text (tool calls) is marked at its last text.
+        last = _last_markable(messages, stable[-1])
+        if last < 0:
+            return messages, []
+        breakpoints = [last]
+        first = stable[0]
+        if first < last and messages[first].get("role") == "system" and _markable(messages[first]):
+            breakpoints.insert(0, first)
+        breakpoints = breakpoints[-self.max_breakpoints:]
+        marked = list(messages)
+        for i in breakpoints:
+            marked[i] = _mark(messages[i])
+        self.hinted += 1
+        PROMPT_CACHE_HINTS.labels(self._label(model)).inc()
+        return marked, breakpoints
+
+    def observe(self, model, prompt_tokens, cached_tokens):
+        """Record prompt tokens and how many the provider served from its cache."""
+        if len(self.prompt_tokens) < 500 or model in self.prompt_tokens:
+            self.prompt_tokens[model] = self.prompt_tokens.get(model, 0) + (prompt_tokens or 0)
+            self.cached_tokens[model] = self.cached_tokens.get(model, 0) + (cached_tokens or 0)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hinted": self.hinted,
+            "prefixes": len(self._seen),
+            "cached_ratio": {
+                model: round(self.cached_tokens[model] / tokens, 3)
+                for model, tokens in self.prompt_tokens.items() if tokens and self.cached_tokens[model]
+            },
+        }
+
+
+def cached_tokens(usage):
+    """Cached prompt tokens from an OpenAI-style usage dict (0 if not reported)."""
+    details = (usage or {}).get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or 0
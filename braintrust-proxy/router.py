@@ -0,0 +1,261 @@
+"""
+Multi-upstream routing with health scores, failover and hedging.
+
+`UPSTREAMS` (JSON) names OpenAI-compatible upstreams and maps model patterns
+to an ordered list of them:
+
+    {"upstreams": {"openrouter": {"base_url": "https://openrouter.ai/api/v1",
+                                  "api_key_env": "OPENROUTER_API_KEY"},
+                   "groq": {"base_url": "https://api.groq.com/openai/v1",
+                            "api_key_env": "GROQ_API_KEY",
+                            "models": {"meta-llama/llama-3.3-70b-instruct": "llama-3.3-70b-versatile"}}},
+     "routes": [{"model": "meta-llama/*", "upstreams": ["groq", "openrouter"]},
+                {"model": "*", "upstreams": ["openrouter"]}]}
+
+Every call feeds a time-decayed health record (mean latency and error rate)
+per upstream. The configured order is kept while upstreams are comparably
+healthy; one whose score degrades past the best is moved to the back.
+Retryable failures (connection errors, timeouts, 408/409/429/5xx) fail over
+to the next upstream. Non-streaming calls can be hedged: if the first
+upstream hasn't answered by its own p95 latency, the next one is raced
+against it and the loser is cancelled.
+
+Without `routes`, every model uses all upstreams in their configured order.
+"""
+import asyncio
+import fnmatch
+import json
+import sys
+import time
+from collections import deque
+
+import openai
+
+from metrics import UPSTREAM_CALLS, UPSTREAM_FAILOVERS, UPSTREAM_HEDGES
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def parse_config(raw):
+    """(upstream specs by name, [(model pattern, [names])]) from `UPSTREAMS` JSON."""
+    if not raw:
+        return {"openrouter": {"base_url": DEFAULT_BASE_URL, "api_key_env": "OPENROUTER_API_KEY"}}, [("*", ["openrouter"])]
+    config = json.loads(raw)
+    upstreams = config["upstreams"]
+    routes = [(route["model"], list(route["upstreams"])) for route in config.get("routes", [])]
+    if not routes:
+        # No routes: every model fails over across all upstreams, in configured order.
+        routes = [("*", list(upstreams))]
+    for pattern, names in routes:
+        unknown = [name for name in names if name not in upstreams]
+        if unknown or not names:
+            raise ValueError(f"UPSTREAMS route {pattern!r} names unknown upstreams {unknown}")
+    return upstreams, routes
+
+
+def retryable(error):
+    """Whether another upstream might succeed where this one failed."""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class Upstream:
+    """One OpenAI-compatible endpoint and its rolling health."""
+
+    def __init__(self, name, client, transport=None, models=None, half_life=30.0, window=200, http_client=None):
+        self.name = name
+        self.client = client
+        self.http_client = http_client  # the client's httpx pool, for raw pass-through calls
+        # Retrying the same upstream only delays failover when there is another to try.
+        self.client_no_retry = client.with_options(max_retries=0)
+        self.transport = transport
+        self.models = models or {}
+        self.half_life = half_life
+        self.calls = 0
+        self.errors = 0
+        self._weight = 0.0
+        self._ok_weight = 0.0
+        self._error_weight = 0.0
+        self._latency_sum = 0.0
+        self._at = time.monotonic()
+        self._window = window
+        self._latencies = {}  # op -> recent successful latencies, for hedge delays
+
+    def upstream_model(self, model):
+        return self.models.get(model, model)
+
+    def record(self, op, elapsed, error):
+        self._decay()
+        self.calls += 1
+        self._weight += 1
+        if error:
+            self.errors += 1
+            self._error_weight += 1
+        else:
+            self._ok_weight += 1
+            self._latency_sum += elapsed
+            self._latencies.setdefault(op, deque(maxlen=self._window)).append(elapsed)
+        UPSTREAM_CALLS.labels(self.name, "error" if error else "ok").inc()
+
+    def _decay(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._at) / self.half_life)
+        self._weight *= factor
+        self._ok_weight *= factor
+        self._error_weight *= factor
+        self._latency_sum *= factor
+        self._at = now
+
+    def score(self):
+        """Expected cost of a call: mean latency inflated by error rate. 0 = no recent data."""
+        self._decay()
+        if self._weight < 1:
+            return 0.0  # idle long enough to deserve another try
+        if self._ok_weight < 0.01:
+            return float("inf")
+        error_rate = self._error_weight / self._weight
+        return self._latency_sum / self._ok_weight * (1 + 4 * error_rate)
+
+    def p95(self, op, min_samples=20):
+        samples = self._latencies.get(op)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def stats(self):
+        score = self.score()
+        snapshot = {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self._error_weight / self._weight, 3) if self._weight else 0.0,
+            "latency_ms": round(self._latency_sum / self._ok_weight * 1000, 1) if self._ok_weight >= 0.01 else None,
+            "score": round(score, 4) if score != float("inf") else "inf",
+            "p95_ms": {op: round(self.p95(op) * 1000, 1) for op in self._latencies if self.p95(op) is not None},
+        }
+        if self.transport is not None:
+            snapshot["pool"] = self.transport.stats()
+        return snapshot
+
+
+class Router:
+    """Pick, fail over between and hedge across upstreams for a model."""
+
+    def __init__(self, upstreams, routes, degrade_ratio=3.0, hedge=False, hedge_min_delay=0.5):
+        self.upstreams = upstreams  # name -> Upstream, in configured order
+        self.routes = routes
+        self.degrade_ratio = degrade_ratio
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        fallback = routes[-1][1] if routes else list(upstreams)
+        self.default = upstreams[fallback[0]]
+
+    def candidates(self, model):
+        """Upstreams for `model`: configured order, degraded ones moved last."""
+        names = next((names for pattern, names in self.routes if fnmatch.fnmatchcase(model, pattern)), None)
+        ups = [self.upstreams[name] for name in names] if names else [self.default]
+        if len(ups) < 2:
+            return ups
+        scores = {up.name: up.score() for up in ups}
+        known = [score for score in scores.values() if 0 < score < float("inf")]
+        limit = min(known) * self.degrade_ratio if known else 0.0
+        healthy = [up for up in ups if scores[up.name] == 0 or scores[up.name] <= limit]
+        degraded = sorted((up for up in ups if up not in healthy), key=lambda up: scores[up.name])
+        return healthy + degraded
+
+    async def call(self, model, fn, op, hedge=False):
+        """Run `await fn(client, upstream_model)` against the best upstream for `model`.
+
+        Returns (result, route) where route records which upstream served it.
+        """
+        candidates = self.candidates(model)
+        route = {"upstream": None, "attempts": 0, "hedged": False}
+        while True:
+            # Every attempt (hedges included) consumes one candidate, in order.
+            upstream = candidates[route["attempts"]]
+            rest = candidates[route["attempts"] + 1:]
+            delay = self._hedge_delay(upstream, op) if hedge and self.hedge and rest else None
+            try:
+                if delay is not None:
+                    result, served = await self._hedged(upstream, rest[0], model, fn, op, delay, route)
+                else:
+                    route["attempts"] += 1
+                    result = await self._attempt(upstream, model, fn, op, last=not rest)
+                    served = upstream
+            except Exception as e:
+                if route["attempts"] >= len(candidates) or not retryable(e):
+                    raise
+                self.failovers += 1
+                UPSTREAM_FAILOVERS.labels(upstream.name).inc()
+                print(f"[Router] {upstream.name} failed for {model} ({type(e).__name__}: {e}); "
+                      f"failing over to {candidates[route['attempts']].name}", file=sys.stderr)
+                continue
+            route["upstream"] = served.name
+            return result, route
+
+    async def _attempt(self, upstream, model, fn, op, last):
+        client = upstream.client if last else upstream.client_no_retry
+        started = time.monotonic()
+        try:
+            result = await fn(client, upstream.upstream_model(model))
+        except asyncio.CancelledError:
+            raise  # lost a hedge race; says nothing about upstream health
+        except Exception as e:
+            # 4xx other than 408/409/429 is the request's fault, not the upstream's.
+            upstream.record(op, time.monotonic() - started, error=retryable(e))
+            raise
+        upstream.record(op, time.monotonic() - started, error=False)
+        return result
+
+    def _hedge_delay(self, upstream, op):
+        p95 = upstream.p95(op)
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    async def _hedged(self, first, second, model, fn, op, delay, route):
+        """Race `second` against `first` once `first` exceeds `delay`.
+
+        Returns (result, upstream that served it).
+        """
+        route["attempts"] += 1
+        primary = asyncio.ensure_future(self._attempt(first, model, fn, op, last=False))
+        owners = {primary: first}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result(), first
+
+            self.hedges += 1
+            route["attempts"] += 1
+            route["hedged"] = True
+            backup = asyncio.ensure_future(self._attempt(second, model, fn, op, last=False))
+            owners[backup] = second
+            pending = set(owners)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        won = owners[task] is second
+                        self.hedge_wins += won
+                        UPSTREAM_HEDGES.labels("hedge" if won else "primary").inc()
+                        return task.result(), owners[task]
+                    error = task.exception()
+            raise error
+        finally:
+            for task in owners:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        return {
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "upstreams": {name: up.stats() for name, up in self.upstreams.items()},
+        }
@@ -0,0 +1,246 @@
+"""
+Background Braintrust log shipper.
+
+Handlers hand finished traces to a bounded in-memory queue and return
+immediately. A per-worker thread drains the queue into Braintrust in
+batches, flushing when a batch fills or the flush interval elapses, so
+request latency never includes observability I/O.
+
+Events can name a Braintrust project (`_project`); each worker keeps an
+LRU of initialized loggers, one per project, created on first use and
+flushed and closed when evicted, so many tenants never mean a logger
+handshake per trace.
+
+With a spool attached, a failed flush moves the batch to disk and the
+shipper stops calling Braintrust until a replay probe succeeds, so an
+outage costs disk, not memory. Replay drains the spool with exponential
+backoff once Braintrust recovers.
+"""
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import LOG_EVENTS, LOG_QUEUE_DEPTH, LOG_SPOOL_EVENTS
+
+
+class LogShipper:
+    """Bounded queue + background thread that batches `logger.log` calls."""
+
+    def __init__(self, logger_factory, max_queue=10000, batch_size=100, flush_interval=1.0,
+                 spool=None, replay_batch=500, max_backoff=300.0, max_loggers=64):
+        self._logger_factory = logger_factory  # project (None = default) -> logger
+        self._loggers = OrderedDict()  # only touched by the shipper thread
+        self.max_loggers = max_loggers
+        self.loggers_created = 0
+        self.loggers_evicted = 0
+        self._spool = spool
+        self._healthy = True
+        self._backoff = 1.0
+        self._next_replay = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_batch = replay_batch
+        self.max_backoff = max_backoff
+        self.shipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.high_water = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """Start the shipper thread (call after the worker has forked)."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="braintrust-shipper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the thread after draining everything already queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, **event):
+        """Queue one `logger.log(**event)` call. Never blocks; False if dropped.
+
+        `_project` routes the event to that project's logger instead of the default.
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            LOG_EVENTS.labels("dropped").inc()
+            return False
+        depth = self._queue.qsize()
+        LOG_QUEUE_DEPTH.set(depth)
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def depth(self):
+        """Number of events waiting to be shipped."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Snapshot for the /stats endpoint (touches the spool; run off the event loop)."""
+        snapshot = {
+            "queue_depth": self.depth(),
+            "queue_max": self.max_queue,
+            "high_water": self.high_water,
+            "shipped": self.shipped,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "braintrust_healthy": self._healthy,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "loggers": {"open": len(self._loggers), "created": self.loggers_created, "evicted": self.loggers_evicted},
+        }
+        if self._spool is not None:
+            snapshot["spool"] = self._spool.backlog()
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            LOG_QUEUE_DEPTH.set(self.depth())
+            if batch:
+                self._deliver(batch)
+            self._replay()
+        # Shutdown: drain whatever is left without waiting on the interval.
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self._deliver(batch)
+        for project in list(self._loggers):
+            self._close_logger(project)
+
+    def _collect(self):
+        """Block until a batch fills, the flush interval elapses, or stop is requested."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _deliver(self, batch):
+        """Ship a live batch, or spill it to disk while Braintrust is down."""
+        if self._healthy or self._spool is None:
+            batch = [batch[i] for i in self._ship(batch)]
+            if not batch:
+                return
+        if self._spool is None:
+            self.failed += len(batch)
+            LOG_EVENTS.labels("failed").inc(len(batch))
+            return
+        try:
+            self._spool.append(batch)
+            self.spilled += len(batch)
+            LOG_EVENTS.labels("spilled").inc(len(batch))
+            LOG_SPOOL_EVENTS.set(self._spool.backlog()["events"])
+        except Exception as e:
+            self.failed += len(batch)
+            LOG_EVENTS.labels("failed").inc(len(batch))
+            print(f"[Spool] Write error, {len(batch)} traces lost: {e}", file=sys.stderr)
+
+    def _replay(self):
+        """Drain one spool chunk to Braintrust once the backoff has elapsed."""
+        if self._spool is None or time.monotonic() < self._next_replay:
+            return
+        try:
+            claimed = self._spool.claim(self.replay_batch)
+        except Exception as e:
+            print(f"[Spool] Read error: {e}", file=sys.stderr)
+            return
+        if not claimed:
+            self._healthy = True
+            return
+        failed = set(self._ship([event for _, event in claimed]))
+        ids = [row_id for i, (row_id, _) in enumerate(claimed) if i not in failed]
+        if ids:
+            self._spool.ack(ids)
+            self.replayed += len(ids)
+            LOG_EVENTS.labels("replayed").inc(len(ids))
+            LOG_SPOOL_EVENTS.set(self._spool.backlog()["events"])
+        if failed:
+            self._spool.release([claimed[i][0] for i in sorted(failed)])
+
+    def _logger(self, project):
+        logger = self._loggers.get(project)
+        if logger is None:
+            logger = self._loggers[project] = self._logger_factory(project)
+            self.loggers_created += 1
+            while len(self._loggers) > self.max_loggers:
+                self._close_logger(next(iter(self._loggers)))
+                self.loggers_evicted += 1
+        self._loggers.move_to_end(project)
+        return logger
+
+    def _close_logger(self, project):
+        logger = self._loggers.pop(project)
+        try:
+            logger.flush()
+            close = getattr(logger, "close", None)
+            if close is not None:
+                close()
+        except Exception as e:
+            print(f"[Braintrust] Error closing logger for {project or 'default project'}: {e}", file=sys.stderr)
+
+    def _ship(self, batch):
+        """Log + flush one batch, one flush per project.
+
+        Returns the indexes of events that could not be shipped (and backs off
+        if there are any); projects after the first failure are not tried.
+        """
+        groups = OrderedDict()
+        for i, event in enumerate(batch):
+            groups.setdefault(event.get("_project"), []).append(i)
+        pending = list(groups.items())
+        start = time.monotonic()
+        shipped = 0
+        try:
+            while pending:
+                project, indexes = pending[0]
+                logger = self._logger(project)
+                for i in indexes:
+                    logger.log(**{key: value for key, value in batch[i].items() if key != "_project"})
+                logger.flush()
+                shipped += len(indexes)
+                pending.pop(0)
+        except Exception as e:
+            failed = [i for _, indexes in pending for i in indexes]
+            self._healthy = False
+            self._next_replay = time.monotonic() + self._backoff
+            print(f"[Braintrust] Ship error ({len(batch) - shipped} events), retry in {self._backoff:.0f}s: {e}",
+                  file=sys.stderr)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            return failed
+        finally:
+            self.last_flush_ms = (time.monotonic() - start) * 1000
+            if shipped:
+                self.shipped += shipped
+                LOG_EVENTS.labels("shipped").inc(shipped)
+        self._healthy = True
+        self._backoff = 1.0
+        return []
@@ -0,0 +1,43 @@
+"""
+Single-flight coalescing of identical in-flight upstream calls.
+
+The first caller for a key starts the upstream call; identical callers that
+arrive while it is still running await the same result instead of making
+their own. The call runs as its own task, so a leader whose client goes
+away doesn't cancel the result the followers are waiting for.
+"""
+import asyncio
+
+from metrics import SINGLE_FLIGHT_SAVED
+
+
+class SingleFlight:
+    """Per-worker map of key -> running task."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.saved = 0
+
+    async def do(self, key, fn):
+        """Run `fn()` once per key at a time. Returns (result, shared)."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.saved += 1
+            SINGLE_FLIGHT_SAVED.inc()
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self):
+        return {"upstream_calls": self.calls, "saved": self.saved, "in_flight": len(self._inflight)}
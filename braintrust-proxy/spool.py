@@ -0,0 +1,127 @@
+"""
+Durable on-disk spool for Braintrust traces.
+
+When Braintrust is unreachable the shipper moves failed batches here
+instead of keeping them in memory. The spool is a SQLite database in WAL
+mode shared by every gunicorn worker; replay claims rows with a lease so
+two workers never ship the same trace, and rows are only deleted once
+Braintrust has accepted them.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import codec
+
+
+class LogSpool:
+    """Append-only, size-capped SQLite queue of `logger.log` kwargs."""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, lease_seconds=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self.evicted = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " leased_until REAL NOT NULL DEFAULT 0)"
+            )
+            # Running event count and total `size`, so neither appends nor
+            # backlog() scan the spool. Seeded from the rows of a spool that
+            # predates it (or an older meta row without the count).
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(meta)")}
+            if columns and "events" not in columns:
+                conn.execute("DROP TABLE meta")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0),"
+                         " events INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (id, events, bytes) SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM spool")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, events):
+        """Persist a batch of events; evicts the oldest rows past max_bytes."""
+        rows = []
+        for event in events:
+            payload = codec.dumps(event, default=str)
+            rows.append((payload, len(payload)))
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO spool (payload, size) VALUES (?, ?)", rows)
+            conn.execute("UPDATE meta SET events = events + ?, bytes = bytes + ? WHERE id = 0",
+                         (len(rows), sum(size for _, size in rows)))
+            total = conn.execute("SELECT bytes FROM meta WHERE id = 0").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn, excess):
+        cutoff, freed, count = None, 0, 0
+        for row_id, size in conn.execute("SELECT id, size FROM spool ORDER BY id"):
+            cutoff, freed, count = row_id, freed + size, count + 1
+            if freed >= excess:
+                break
+        if cutoff is not None:
+            conn.execute("DELETE FROM spool WHERE id <= ?", (cutoff,))
+            conn.execute("UPDATE meta SET events = events - ?, bytes = bytes - ? WHERE id = 0", (count, freed))
+            self.evicted += count
+            print(f"[Spool] Size cap reached, evicted {count} oldest traces", file=sys.stderr)
+
+    def claim(self, limit):
+        """Lease up to `limit` of the oldest unleased events for replay."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, payload FROM spool WHERE leased_until < ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE spool SET leased_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row_id) for row_id, _ in rows],
+                )
+        return [(row_id, codec.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids):
+        """Delete events Braintrust has accepted."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            deleted, freed = 0, 0
+            for row_id in ids:
+                # Rows may have been evicted while leased; only count what is deleted.
+                row = conn.execute("SELECT size FROM spool WHERE id = ?", (row_id,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM spool WHERE id = ?", (row_id,))
+                    deleted, freed = deleted + 1, freed + row[0]
+            conn.execute("UPDATE meta SET events = events - ?, bytes = bytes - ? WHERE id = 0", (deleted, freed))
+
+    def release(self, ids):
+        """Return leased events to the queue after a failed replay."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE spool SET leased_until = 0 WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def backlog(self):
+        """Events and bytes waiting on disk (shared across workers)."""
+        count, size = self._conn().execute("SELECT events, bytes FROM meta WHERE id = 0").fetchone()
+        return {"events": count, "bytes": size, "max_bytes": self.max_bytes, "evicted": self.evicted}
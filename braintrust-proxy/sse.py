@@ -0,0 +1,148 @@
+"""
+Zero-reserialization SSE passthrough.
+
+Upstream `text/event-stream` bytes are forwarded to the client unchanged,
+one complete event at a time. `SSETap` sits on the side: it json-decodes
+each `data:` payload once to collect content deltas (into a list, joined
+once at the end) and stream metadata for the Braintrust trace, but never
+re-encodes anything the client receives.
+
+The tap also timestamps every generated delta (content, reasoning or tool
+call), so TTFT and the inter-chunk gap distribution come for free. When the
+proxy asked upstream for `stream_options.include_usage` on the client's
+behalf, `strip_usage` drops the trailing usage-only chunk the client never
+asked for.
+"""
+import re
+import time
+
+import codec
+
+_EVENT_END = re.compile(rb"\r?\n\r?\n")
+
+
+class SSETap:
+    """Split an SSE byte stream into events and record what the trace needs."""
+
+    def __init__(self, strip_usage=False):
+        self.strip_usage = strip_usage
+        self._buffer = b""
+        self.parts = []
+        self.chunks = 0
+        self.done = False
+        self.id = None
+        self.model = None
+        self.created = None
+        self.finish_reason = None
+        self.usage = None
+        self.error = None
+        self.first_token_at = None
+        self.last_token_at = None
+        self.gaps = []
+
+    def feed(self, data):
+        """Return the complete events in `data` (bytes, unchanged) and tap them."""
+        buffer = self._buffer + data if self._buffer else data
+        events = []
+        start = 0
+        for match in _EVENT_END.finditer(buffer):
+            event = buffer[start:match.end()]
+            if self._tap(event):
+                events.append(event)
+            start = match.end()
+        self._buffer = buffer[start:]
+        return events
+
+    def close(self):
+        """Return any trailing bytes left without an event terminator."""
+        rest, self._buffer = self._buffer, b""
+        if rest.strip() and self._tap(rest):
+            return [rest]
+        return []
+
+    @property
+    def content(self):
+        return "".join(self.parts)
+
+    def completion(self):
+        """The stream as a non-streaming `chat.completion` body (for caching)."""
+        return {
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": self.finish_reason,
+            }],
+            "usage": self.usage,
+        }
+
+    def _tap(self, event):
+        """Record the event; False if it should not be forwarded."""
+        forward = True
+        for line in event.splitlines():
+            if not line.startswith(b"data:"):
+                continue  # comments (": keep-alive"), event:, id:, retry:
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                self.done = True
+                continue
+            try:
+                chunk = codec.loads(payload)
+            except ValueError:
+                continue
+            if self._record(chunk) and self.strip_usage:
+                forward = False
+        return forward
+
+    def _record(self, chunk):
+        """Tap one chunk; True if it is a usage-only chunk (no choices)."""
+        self.chunks += 1
+        if "error" in chunk:
+            self.error = chunk["error"]
+        if self.id is None:
+            self.id = chunk.get("id")
+            self.model = chunk.get("model")
+            self.created = chunk.get("created")
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        choices = chunk.get("choices")
+        if not choices:
+            return bool(chunk.get("usage"))
+        choice = choices[0]
+        delta = choice.get("delta") or {}
+        content = delta.get("content")
+        if content:
+            self.parts.append(content)
+        if content or delta.get("reasoning") or delta.get("tool_calls"):
+            now = time.monotonic()
+            if self.first_token_at is None:
+                self.first_token_at = now
+            else:
+                self.gaps.append(now - self.last_token_at)
+            self.last_token_at = now
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+        return False
+
+
+def completion_events(completion):
+    """Replay a cached `chat.completion` body as SSE events for stream callers."""
+    base = {
+        "id": completion.get("id"),
+        "object": "chat.completion.chunk",
+        "created": completion.get("created"),
+        "model": completion.get("model"),
+    }
+    events = []
+    for choice in completion.get("choices") or []:
+        message = choice.get("message") or {}
+        delta = {"role": message.get("role", "assistant"), "content": message.get("content") or ""}
+        if message.get("tool_calls"):
+            delta["tool_calls"] = [dict(call, index=i) for i, call in enumerate(message["tool_calls"])]
+        index = choice.get("index", 0)
+        events.append({**base, "choices": [{"index": index, "delta": delta, "finish_reason": None}]})
+        events.append({**base, "choices": [{"index": index, "delta": {}, "finish_reason": choice.get("finish_reason")}]})
+    return [b"data: " + codec.dumps(chunk) + b"\n\n" for chunk in events] + [b"data: [DONE]\n\n"]
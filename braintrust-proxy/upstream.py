@@ -0,0 +1,97 @@
+"""
+Pooled keep-alive transport for upstream API calls.
+
+Each worker builds its own client after gunicorn forks (sockets must never
+be shared across processes), with explicit pool limits, keep-alive expiry
+and separate connect/read/write/pool timeouts. HTTP/2 is negotiated via
+ALPN when the `h2` package is installed, so concurrent streams to the same
+host multiplex over a few warm connections instead of paying a TCP + TLS
+handshake each. The transport counts requests, new connections and TLS
+handshakes, which is how reuse is observed.
+"""
+import sys
+import time
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+from metrics import UPSTREAM_CONNECTIONS, UPSTREAM_HTTP_REQUESTS, UPSTREAM_TLS_HANDSHAKE
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that traces connection setup on every request."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.tls_seconds = 0.0
+        self.http_versions = {}
+
+    async def handle_async_request(self, request):
+        self.requests += 1
+        request.extensions = {**request.extensions, "trace": self._tracer()}
+        response = await super().handle_async_request(request)
+        version = response.extensions.get("http_version", b"").decode() or "unknown"
+        self.http_versions[version] = self.http_versions.get(version, 0) + 1
+        UPSTREAM_HTTP_REQUESTS.labels(version).inc()
+        return response
+
+    def _tracer(self):
+        started = {}
+
+        async def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                self.connections_opened += 1
+                UPSTREAM_CONNECTIONS.inc()
+            elif event == "connection.start_tls.started":
+                started["tls"] = time.monotonic()
+            elif event == "connection.start_tls.complete" and "tls" in started:
+                elapsed = time.monotonic() - started.pop("tls")
+                self.tls_handshakes += 1
+                self.tls_seconds += elapsed
+                UPSTREAM_TLS_HANDSHAKE.observe(elapsed)
+
+        return trace
+
+    def stats(self):
+        connections = list(self._pool.connections)
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "reuse_ratio": round(1 - self.connections_opened / self.requests, 3) if self.requests else 0.0,
+            "tls_handshakes": self.tls_handshakes,
+            "tls_ms_mean": round(self.tls_seconds * 1000 / self.tls_handshakes, 1) if self.tls_handshakes else 0.0,
+            "open": len(connections),
+            "idle": idle,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+def build_http_client(http2=True, max_connections=100, max_keepalive=20, keepalive_expiry=60.0,
+                      connect_timeout=5.0, read_timeout=300.0, write_timeout=30.0, pool_timeout=10.0):
+    """(httpx client for AsyncOpenAI(http_client=...), its transport, timeout)."""
+    if http2 and not http2_available():
+        print("[Upstream] h2 not installed; using HTTP/1.1", file=sys.stderr)
+        http2 = False
+    transport = PooledTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    # The read timeout bounds the gap between bytes, not the whole stream.
+    timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout)
+    return DefaultAsyncHttpxClient(transport=transport, timeout=timeout), transport, timeout
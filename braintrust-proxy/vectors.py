@@ -0,0 +1,62 @@
+"""
+Embedding vector encodings.
+
+Vectors stay packed little-endian float32 bytes from upstream to client:
+the proxy asks upstream for `encoding_format: "base64"` and decodes only
+the base64, the embedding cache stores the bytes, and the response is
+assembled around them. Python float lists appear only for clients that
+want `"float"` (the OpenAI default, and the JSON floats they parse).
+
+`"base64"` answers as OpenAI does (base64 of float32). `"float16"` is an
+opt-in extension for clients that accept it: base64 of little-endian
+IEEE half floats, half the bytes of base64 float32 and about a sixth of
+the JSON floats. The conversion uses numpy when it is installed.
+"""
+import base64
+import struct
+from array import array
+
+import codec
+
+try:
+    import numpy
+except ImportError:  # optional: only speeds up float16 packing
+    numpy = None
+
+FORMATS = ("float", "base64", "float16")
+
+
+def decode_embedding(value):
+    """float32 bytes from an upstream `embedding` (base64 string, or floats if upstream ignored base64)."""
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return array("f", value).tobytes()
+
+
+def to_float16(vec):
+    """float32 bytes -> float16 bytes."""
+    if numpy is not None:
+        return numpy.frombuffer(vec, dtype="<f4").astype("<f2").tobytes()
+    count = len(vec) // 4
+    return struct.pack(f"<{count}e", *struct.unpack(f"<{count}f", vec))
+
+
+def embeddings_body(vectors, model, prompt_tokens, encoding_format="float"):
+    """The `/v1/embeddings` response body (bytes) for float32 `vectors`."""
+    usage = {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+    if encoding_format == "float":
+        return codec.dumps({
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": array("f", vec).tolist()}
+                     for i, vec in enumerate(vectors)],
+            "model": model,
+            "usage": usage,
+        })
+    if encoding_format == "float16":
+        vectors = [to_float16(vec) for vec in vectors]
+    # base64 needs no JSON escaping: splice it in instead of json.dumps-ing
+    # megabytes of strings.
+    items = b",".join(b'{"object":"embedding","index":%d,"embedding":"%s"}' % (i, base64.b64encode(vec))
+                      for i, vec in enumerate(vectors))
+    tail = codec.dumps({"model": model, "usage": usage})[1:]
+    return b'{"object":"list","data":[' + items + b"]," + tail